@@ -13,6 +13,7 @@ from asteroid.interp import interp
 from asteroid.repl import repl
 from asteroid.version import VERSION
 from asteroid.mad import MAD
+from asteroid.walk import escape_cache_info
 
 def display_help():
     print("Asteroid {}".format(VERSION))
@@ -20,6 +21,8 @@ def display_help():
     print("usage: asteroid [<switch>] <input file>")
     print("")
     print("command line switches:")
+    print(" -b             run program on the bytecode machine")
+    print(" -c             run program with the closure compiler")
     print(" -d             run program through debugger")
     print(" -e             show Python exceptions")
     print(" -F             functional mode")
@@ -31,12 +34,14 @@ def display_help():
     print(" -v, --version  version")
     print(" -w             disable tree walk")
     print(" -W             disable warnings")
-    print(" -z             generate pstats")
+    print(" -z             generate pstats and escape cache statistics")
 
 def main():
     # defaults for the switches or flags - when the flag is set on the command line
     # it simply toggles the default value in this table.
     flags = {
+        '-b' : False,  # bytecode machine flag
+        '-c' : False,  # closure compiler flag
         '-d' : False,    # Short debugger flag
         '-e' : False,  # show full exceptions
         '-F' : False,  # functional mode
@@ -86,6 +91,16 @@ def main():
 
     debug_flag = flags['-d']
 
+    if flags['-b'] and flags['-c']:
+        print("error: switches -b and -c cannot be combined")
+        sys.exit(1)
+    elif flags['-b']:
+        engine = 'vm'
+    elif flags['-c']:
+        engine = 'compile'
+    else:
+        engine = 'walk'
+
     # determine if we are starting in interactive mode or not
     # Note: first non-switch argument has to be an Asteroid source file
     if len(sys.argv) == argv_ix:
@@ -132,13 +147,17 @@ def main():
            tree_dump=flags['-t'],
            do_walk=flags['-w'],
            warnings=flags['-W'],
-           debugger=db
+           debugger=db,
+           engine=engine
            )'''
 
     if flags['-z']:
         # generates pstats into the file 'pstats'
         # see https://docs.python.org/3/library/profile.html
         cProfile.runctx(interp_object, globals(), locals(), filename='pstats')
+        (hits, misses, size, rate) = escape_cache_info()
+        print("escape cache: {} hits, {} misses, {} entries, hit rate {:.1%}"
+              .format(hits, misses, size, rate))
     else:
         exec(interp_object)
 
@@ -0,0 +1,749 @@
+#########################################################################
+# A closure compiler for Asteroid programs
+#
+# the compiler translates the tuple AST into nested Python closures once
+# and executes a program by calling the closures.  node types and operands
+# are resolved at compile time, at run time a closure simply calls the
+# closures of its children.  the semantics of the compiled code is exactly
+# the semantics of the tree walker and node types the compiler does not
+# know about are handed off to the tree walker.
+#
+# (c) University of Rhode Island
+#########################################################################
+
+from asteroid.globals import *
+from asteroid.support import *
+from asteroid.state import state, warning
+from asteroid.walk import walk, engines, pattern_matcher, match_failed, declare_unifiers, \
+     read_at_ix, to_list, completed, \
+     is_range_exp, to_range, apply_range, read_range_at_ix, range_length, \
+     loop_terms, in_list, \
+     function_name, apply_function, handle_call, tail_call, \
+     exception_value, select_catch, binary_operator_functions, \
+     short_circuit_functions, unary_operator_functions, \
+     nullary_operator_functions
+from asteroid.resolver import address_of
+
+#########################################################################
+# compiled code is cached by node identity in a bounded cache, see
+# 'NodeCache' in support.py.  the cache has room for the nodes of large
+# programs, every expression and statement node has an entry.
+compile_cache = NodeCache(2**16)
+
+def compile_node(node):
+    '''
+    return the closure for the given AST node.
+    '''
+    code = compile_cache.get(node)
+    if code:
+        return code
+
+    type = node[0]
+    if type in compile_dict:
+        code = compile_dict[type](node)
+    else:
+        # let the tree walker deal with it, this includes the
+        # error message for unknown node types
+        code = lambda : walk(node)
+
+    compile_cache.put(node, code)
+    return code
+
+def execute(node):
+    '''
+    compile the given AST node and run it, this is the entry point of
+    the closure compiler as an execution engine.
+    '''
+    return compile_node(node)()
+
+#########################################################################
+# statements
+#########################################################################
+def compile_stmt_list(node):
+
+    (STMT_LIST, (LIST, stmts)) = node
+    assert_match(STMT_LIST, 'stmt-list')
+    assert_match(LIST, 'list')
+
+    # the parser prefixes every statement with its lineinfo, statement
+    # lists of any other shape are left to the tree walker.
+    if len(stmts) % 2 \
+       or any(stmts[i][0] != 'lineinfo' or stmts[i+1][0] == 'lineinfo'
+              for i in range(0, len(stmts), 2)):
+        return lambda : walk(node)
+
+    statements = [(stmts[i][1], compile_node(stmts[i+1]))
+                  for i in range(0, len(stmts), 2)]
+
+    # the completion of a statement list is the completion of its last
+    # statement, see 'program_value' in the tree walker.
+    if len(statements) == 1:
+        ((lineinfo, code),) = statements
+        def stmt_list():
+            state.lineinfo = lineinfo
+            return code()
+    else:
+        def stmt_list():
+            completion = None
+            for (lineinfo, code) in statements:
+                state.lineinfo = lineinfo
+                completion = code()
+                if isinstance(completion, ReturnValue):
+                    break
+            return completion
+    return stmt_list
+
+#########################################################################
+def compile_lineinfo(node):
+
+    (LINEINFO, lineinfo_val) = node
+    assert_match(LINEINFO, 'lineinfo')
+
+    def lineinfo():
+        state.lineinfo = lineinfo_val
+    return lineinfo
+
+#########################################################################
+def compile_exp_stmt(node):
+
+    (EXP_STMT, exp) = node
+    assert_match(EXP_STMT, 'exp-stmt')
+
+    exp_code = compile_node(exp)
+    def exp_stmt():
+        if state.debugger: state.debugger.step()
+        return exp_code()
+    return exp_stmt
+
+#########################################################################
+def compile_unify_stmt(node):
+
+    (UNIFY, pattern, exp) = node
+    assert_match(UNIFY, 'unify')
+
+    exp_code = compile_node(exp)
+    matcher = pattern_matcher(pattern)
+
+    if pattern[0] != 'id' or pattern[1] in ['_', 'this']:
+        def unify_stmt():
+            if state.debugger: state.debugger.step()
+            unifiers = matcher(exp_code())
+            if unifiers is None:
+                raise match_failed()
+            declare_unifiers(unifiers)
+        return unify_stmt
+
+    # a plain variable on the left side, this is what the matcher and
+    # declare_unifiers do for variable patterns.
+    name = pattern[1]
+    def unify_var_stmt():
+        if state.debugger: state.debugger.step()
+        term = exp_code()
+        if term[0] in unify_not_allowed_terms:
+            unifiers = matcher(term)
+            if unifiers is None:
+                raise match_failed()
+            declare_unifiers(unifiers)
+            return
+        symbol_table = state.symbol_table
+        id_val = symbol_table.lookup_sym(name, strict=False)
+        if id_val and id_val[0] == 'pattern':
+            warning("you are overwriting a pattern stored in '{}'".format(name))
+        symbol_table.enter_sym(name, term)
+    return unify_var_stmt
+
+#########################################################################
+def compile_return_stmt(node):
+
+    (RETURN, e) = node
+    assert_match(RETURN, 'return')
+
+    e_code = compile_node(e)
+    def return_stmt():
+        if state.debugger: state.debugger.step()
+        return ReturnValue(e_code())
+    return return_stmt
+
+#########################################################################
+def compile_tail_call_stmt(node):
+
+    (TAIL_CALL, (APPLY, f, arg)) = node
+    assert_match(TAIL_CALL, 'tail-call')
+
+    # malformed function expressions are reported when they are
+    # executed, leave them to the tree walker.
+    try:
+        f_name = function_name(f)
+    except Exception:
+        return lambda : walk(node)
+
+    f_code = compile_node(f)
+    arg_code = compile_node(arg)
+    def tail_call_stmt():
+        if state.debugger: state.debugger.step()
+        f_val = f_code()
+        arg_val = arg_code()
+        return tail_call(f, f_name, f_val, arg_val)
+    return tail_call_stmt
+
+#########################################################################
+def compile_break_stmt(node):
+
+    (BREAK,) = node
+    assert_match(BREAK, 'break')
+
+    def break_stmt():
+        if state.debugger: state.debugger.step()
+        raise Break()
+    return break_stmt
+
+#########################################################################
+def compile_throw_stmt(node):
+
+    (THROW, object) = node
+    assert_match(THROW, 'throw')
+
+    object_code = compile_node(object)
+    def throw_stmt():
+        if state.debugger: state.debugger.step()
+        raise ThrowValue(object_code())
+    return throw_stmt
+
+#########################################################################
+def compile_try_stmt(node):
+
+    (TRY,
+     try_stmts,
+     (CATCH_LIST, (LIST, catch_list))) = node
+
+    try_code = compile_node(try_stmts)
+    catch_code = [compile_node(catch_stmts)
+                  for (CATCH, CATCH_PATTERN, catch_stmts) in catch_list]
+
+    def try_stmt():
+        if state.debugger: state.debugger.step()
+        try:
+            completion = try_code()
+        except ReturnValue as inst:
+            # return values should never be captured by user level try stmts
+            raise inst
+        except Exception as inst:
+            except_val = exception_value(inst)
+            inst_val = inst
+        else:
+            return completion
+
+        i = select_catch(except_val, catch_list)
+        if i is None:
+            raise inst_val
+        return catch_code[i]()
+    return try_stmt
+
+#########################################################################
+def compile_loop_stmt(node):
+
+    (LOOP, body_stmts) = node
+    assert_match(LOOP, 'loop')
+
+    body_code = compile_node(body_stmts)
+    def loop_stmt():
+        if state.debugger: state.debugger.step()
+        completion = None
+        try:
+            while True:
+                completion = body_code()
+                if isinstance(completion, ReturnValue):
+                    break
+        except Break:
+            completion = None
+        return completion
+    return loop_stmt
+
+#########################################################################
+def compile_while_stmt(node):
+
+    (WHILE, (COND_EXP, cond), body_stmts) = node
+    assert_match(WHILE, 'while')
+
+    cond_code = compile_node(cond)
+    body_code = compile_node(body_stmts)
+    def while_stmt():
+        if state.debugger: state.debugger.step()
+        completion = None
+        try:
+            (cond_type, cond_val) = cond_code()
+            if cond_type != 'boolean':
+                raise ValueError("found '{}' expected 'boolean' in while loop"
+                                 .format(cond_type))
+            while cond_val:
+                completion = body_code()
+                if isinstance(completion, ReturnValue):
+                    break
+                (cond_type, cond_val) = cond_code()
+                if cond_type != 'boolean':
+                    raise ValueError("found '{}' expected 'boolean' in while loop"
+                                     .format(cond_type))
+        except Break:
+            completion = None
+        return completion
+    return while_stmt
+
+#########################################################################
+def compile_repeat_stmt(node):
+
+    (REPEAT, body_stmts, (COND_EXP, cond)) = node
+    assert_match(REPEAT, 'repeat')
+
+    body_code = compile_node(body_stmts)
+    cond_code = compile_node(cond)
+    def repeat_stmt():
+        if state.debugger: state.debugger.step()
+        completion = None
+        try:
+            while True:
+                completion = body_code()
+                if isinstance(completion, ReturnValue):
+                    break
+                (cond_type, cond_val) = cond_code()
+                if cond_type != 'boolean':
+                    raise ValueError("found '{}' expected 'boolean' in repeat loop"
+                                     .format(cond_type))
+                if cond_val:
+                    break
+        except Break:
+            completion = None
+        return completion
+    return repeat_stmt
+
+#########################################################################
+def compile_for_stmt(node):
+
+    (FOR, (IN_EXP, in_exp), stmt_list) = node
+    assert_match(FOR, 'for')
+
+    (IN, pattern, list_term) = in_exp
+
+    if is_range_exp(list_term):
+        list_code = compile_range(list_term)
+    else:
+        list_code = compile_node(list_term)
+    body_code = compile_node(stmt_list)
+    matcher = pattern_matcher(pattern)
+    def for_stmt():
+        if state.debugger: state.debugger.step()
+
+        list_val = loop_terms(list_code())
+
+        completion = None
+        try:
+            for term in list_val:
+                unifiers = matcher(term)
+                if unifiers is not None:
+                    declare_unifiers(unifiers)
+                    completion = body_code()
+                    if isinstance(completion, ReturnValue):
+                        break
+        except Break:
+            completion = None
+        return completion
+    return for_stmt
+
+#########################################################################
+def compile_match_stmt(node):
+
+    (MATCH, val, if_clauses) = node
+    assert_match(MATCH, 'match')
+
+    val_code = compile_node(val)
+    if_code = compile_node(if_clauses)
+    def match_stmt():
+        if state.debugger: state.debugger.step()
+        val_code()
+        return if_code()
+    return match_stmt
+
+#########################################################################
+def compile_if_stmt(node):
+
+    (IF, (LIST, if_list)) = node
+    assert_match(IF, 'if')
+    assert_match(LIST, 'list')
+
+    clauses = []
+    for i in range(0,len(if_list),2):
+        (LINEINFO, lineinfo) = if_list[i]
+        (IF_CLAUSE,
+         (COND, cond),
+         stmts) = if_list[i+1]
+        clauses.append((lineinfo, compile_node(cond), compile_node(stmts)))
+
+    def if_stmt():
+        if state.debugger: state.debugger.step()
+        for (lineinfo, cond_code, stmts_code) in clauses:
+            state.lineinfo = lineinfo
+            (cond_type, cond_val) = cond_code()
+            if cond_type != 'boolean':
+                raise ValueError("found '{}' expected 'boolean' in if clause"
+                                 .format(cond_type))
+            if cond_val:
+                return stmts_code()
+    return if_stmt
+
+#########################################################################
+def compile_module_def_stmt(node):
+
+    (MODULE_DEF, (ID, modname), stmts) = node
+    assert_match(MODULE_DEF, 'module-def')
+
+    stmts_code = compile_node(stmts)
+    def module_def_stmt():
+        state.symbol_table.push_scope({})
+        if state.debugger: state.debugger.enter_module(modname)
+        completed(stmts_code())
+        closure = state.symbol_table.get_closure()
+        if state.debugger: state.debugger.exit_module(modname)
+        state.symbol_table.pop_scope()
+
+        module_type = ('module', ('id', modname), ('scope', closure))
+        state.symbol_table.enter_sym(modname, module_type)
+    return module_def_stmt
+
+#########################################################################
+def compile_load_stmt(node):
+
+    (LOAD_STMT, inlist) = node
+    assert_match(LOAD_STMT, 'load-stmt')
+
+    inlist_code = compile_node(inlist)
+    def load_stmt():
+        if state.debugger: state.debugger.step()
+        inlist_code()
+    return load_stmt
+
+#########################################################################
+# expressions
+#########################################################################
+constant_types = ['none', 'nil', 'string', 'integer', 'real', 'boolean']
+
+def compile_constant(node):
+    return lambda : node
+
+#########################################################################
+def compile_id_exp(node):
+
+    (ID, name) = node
+
+    (kind, depth) = address_of(node)
+
+    if kind == 'slot' and depth == 0:
+        def id_exp():
+            symbol_table = state.symbol_table
+            try:
+                return symbol_table.scope.symbols[name]
+            except KeyError:
+                return symbol_table.lookup_sym(name)
+    elif kind == 'slot':
+        def id_exp():
+            symbol_table = state.symbol_table
+            try:
+                return symbol_table.lookup_slot(name, depth)
+            except (KeyError, IndexError):
+                return symbol_table.lookup_sym(name)
+    elif depth > 0:
+        def id_exp():
+            return state.symbol_table.lookup_sym(name, depth=depth)
+    else:
+        def id_exp():
+            return state.symbol_table.lookup_sym(name)
+    return id_exp
+
+#########################################################################
+def compile_apply_exp(node):
+
+    (APPLY, f, arg) = node
+    assert_match(APPLY, 'apply')
+
+    if f[0] == 'id' and f[1] in builtins:
+        return compile_builtin(node)
+
+    # malformed function expressions are reported when they are
+    # executed, leave them to the tree walker.
+    try:
+        f_name = function_name(f)
+    except Exception:
+        return lambda : walk(node)
+
+    # the length of a range does not need the list
+    if f[0] == 'index' and f[2] == ('id', 'length') and is_range_exp(f[1]):
+        range_code = compile_range(f[1])
+        arg_code = compile_node(arg)
+        return lambda : range_length(f, range_code(), arg_code())
+
+    f_code = compile_node(f)
+    arg_code = compile_node(arg)
+    def apply_exp():
+        f_val = f_code()
+        arg_val = arg_code()
+        if f_val[0] == 'function-val' and f_val[1][0] != 'native':
+            return handle_call(None, f_val, arg_val, f_name)
+        return apply_function(f, f_name, f_val, arg_val)
+    return apply_exp
+
+#########################################################################
+def compile_builtin(node):
+
+    (APPLY, (ID, opname), args) = node
+
+    if opname in binary_operators \
+       and args[0] == 'tuple' and len(args[1]) == 2 \
+       and (opname in short_circuit_functions
+            or opname in binary_operator_functions):
+        (TUPLE, [a,b]) = args
+        a_code = compile_node(a)
+        b_code = compile_node(b)
+        if opname in short_circuit_functions:
+            op = short_circuit_functions[opname]
+            return lambda : op(a_code(), b_code)
+        op = binary_operator_functions[opname]
+        # constant operands are passed to the operator as values,
+        # e.g. 'i + 1' or '2 * x'
+        if b[0] in constant_types:
+            return lambda : op(a_code(), b)
+        elif a[0] in constant_types:
+            return lambda : op(a, b_code())
+        else:
+            return lambda : op(a_code(), b_code())
+
+    elif opname in unary_operator_functions:
+        op = unary_operator_functions[opname]
+        args_code = compile_node(args)
+        return lambda : op(args_code())
+
+    elif opname in nullary_operator_functions:
+        op = nullary_operator_functions[opname]
+        args_code = compile_node(args)
+        return lambda : op(args_code())
+
+    else:
+        # let the tree walker report the problem
+        return lambda : walk(node)
+
+#########################################################################
+def compile_index_exp(node):
+
+    (INDEX, structure, ix) = node
+    assert_match(INDEX, 'index')
+
+    if is_range_exp(structure):
+        range_code = compile_range(structure)
+        def index_range_exp():
+            r = range_code()
+            if isinstance(r, range):
+                return read_range_at_ix(r, ix)
+            return read_at_ix(r, ix)
+        return index_range_exp
+
+    structure_code = compile_node(structure)
+    def index_exp():
+        return read_at_ix(structure_code(), ix)
+    return index_exp
+
+#########################################################################
+def compile_list_exp(node):
+
+    (LIST, inlist) = node
+    assert_match(LIST, 'list')
+
+    code_list = [compile_node(e) for e in inlist]
+    def list_exp():
+        return ('list', [code() for code in code_list])
+    return list_exp
+
+#########################################################################
+def compile_tuple_exp(node):
+
+    (TUPLE, intuple) = node
+    assert_match(TUPLE, 'tuple')
+
+    code_list = [compile_node(e) for e in intuple]
+    def tuple_exp():
+        return ('tuple', [code() for code in code_list])
+    return tuple_exp
+
+#########################################################################
+def compile_is_exp(node):
+
+    (IS, term, pattern) = node
+    assert_match(IS, 'is')
+
+    term_code = compile_node(term)
+    matcher = pattern_matcher(pattern)
+    def is_exp():
+        term_val = term_code()
+        unifiers = matcher(term_val)
+        if unifiers is None:
+            return ('boolean', False)
+        else:
+            declare_unifiers(unifiers)
+            return ('boolean', True)
+    return is_exp
+
+#########################################################################
+def compile_in_exp(node):
+
+    (IN, exp, exp_list) = node
+    assert_match(IN, 'in')
+
+    exp_code = compile_node(exp)
+    if is_range_exp(exp_list):
+        range_code = compile_range(exp_list)
+        return lambda : in_list(exp_code(), range_code())
+
+    exp_list_code = compile_node(exp_list)
+    def in_exp():
+        exp_val = exp_code()
+        exp_list_val = exp_list_code()
+        if exp_list_val[0] != 'list':
+            return in_list(exp_val, exp_list_val)
+        return boolean_value(exp_val in exp_list_val[1])
+    return in_exp
+
+#########################################################################
+def compile_if_exp(node):
+
+    (IF_EXP, cond_exp, then_exp, else_exp) = node
+    assert_match(IF_EXP, 'if-exp')
+
+    if else_exp[0] == 'null':
+        return lambda : walk(node)
+
+    cond_code = compile_node(cond_exp)
+    then_code = compile_node(then_exp)
+    else_code = compile_node(else_exp)
+    def if_exp():
+        (cond_type, cond_val) = cond_code()
+        if cond_type != 'boolean':
+            raise ValueError("found '{}' expected 'boolean' in if expression"
+                             .format(cond_type))
+        if cond_val:
+            return then_code()
+        else:
+            return else_code()
+    return if_exp
+
+#########################################################################
+def compile_to_list_exp(node):
+
+    (TOLIST,
+     (START, start),
+     (STOP, stop),
+     (STEP, step)) = node
+
+    start_code = compile_node(start)
+    stop_code = compile_node(stop)
+    step_code = compile_node(step)
+    def to_list_exp():
+        return to_list(start_code(), stop_code(), step_code())
+    return to_list_exp
+
+#########################################################################
+# range expressions that are the operands of the for statement, the 'in'
+# operator, indexing, and the 'length' member function evaluate to Python
+# ranges, see 'is_range_exp' in the tree walker.
+def compile_range(node):
+
+    if node[0] == 'apply':
+        (APPLY, f, arg) = node
+        f_code = compile_node(f)
+        arg_code = compile_node(arg)
+        return lambda : apply_range(f, f_code(), arg_code())
+
+    (TOLIST,
+     (START, start),
+     (STOP, stop),
+     (STEP, step)) = node
+
+    start_code = compile_node(start)
+    stop_code = compile_node(stop)
+    step_code = compile_node(step)
+    return lambda : to_range(start_code(), stop_code(), step_code())
+
+#########################################################################
+def compile_head_tail_exp(node):
+
+    (HEAD_TAIL, head, tail) = node
+
+    head_code = compile_node(head)
+    tail_code = compile_node(tail)
+    def head_tail_exp():
+        head_val = head_code()
+        (TAIL_TYPE, tail_val) = tail_code()
+        if TAIL_TYPE != 'list':
+            raise ValueError(
+                "unsupported tail type '{}' in head-tail operator".
+                format(TAIL_TYPE))
+        return ('list', [head_val] + tail_val)
+    return head_tail_exp
+
+#########################################################################
+def compile_function_exp(node):
+
+    (FUNCTION_EXP, body_list) = node
+    assert_match(FUNCTION_EXP, 'function-exp')
+
+    def function_exp():
+        return ('function-val',
+                body_list,
+                state.symbol_table.get_closure())
+    return function_exp
+
+#########################################################################
+# a dictionary to associate tree nodes with compile functions, node
+# types not listed here are executed by the tree walker.
+compile_dict = {
+    # statements
+    'load-stmt'     : compile_load_stmt,
+    'stmt-list'     : compile_stmt_list,
+    'lineinfo'      : compile_lineinfo,
+    'exp-stmt'      : compile_exp_stmt,
+    'noop'          : lambda node : lambda : None,
+    'unify'         : compile_unify_stmt,
+    'while'         : compile_while_stmt,
+    'loop'          : compile_loop_stmt,
+    'repeat'        : compile_repeat_stmt,
+    'for'           : compile_for_stmt,
+    'return'        : compile_return_stmt,
+    'tail-call'     : compile_tail_call_stmt,
+    'break'         : compile_break_stmt,
+    'match'         : compile_match_stmt,
+    'if'            : compile_if_stmt,
+    'throw'         : compile_throw_stmt,
+    'try'           : compile_try_stmt,
+    'module-def'    : compile_module_def_stmt,
+    # expressions
+    'list'          : compile_list_exp,
+    'tuple'         : compile_tuple_exp,
+    'to-list'       : compile_to_list_exp,
+    'raw-to-list'   : compile_to_list_exp,
+    'head-tail'     : compile_head_tail_exp,
+    'raw-head-tail' : compile_head_tail_exp,
+    'none'          : compile_constant,
+    'nil'           : compile_constant,
+    'function-exp'  : compile_function_exp,
+    'string'        : compile_constant,
+    'integer'       : compile_constant,
+    'real'          : compile_constant,
+    'boolean'       : compile_constant,
+    'object'        : compile_constant,
+    'pattern'       : compile_constant,
+    'foreign'       : compile_constant,
+    'member-function-val' : compile_constant,
+    'id'            : compile_id_exp,
+    'apply'         : compile_apply_exp,
+    'index'         : compile_index_exp,
+    'is'            : compile_is_exp,
+    'in'            : compile_in_exp,
+    'if-exp'        : compile_if_exp,
+}
+
+engines['compile'] = execute
@@ -8,7 +8,7 @@ import os
 import sys
 from pathlib import Path, PurePath
 
-from asteroid.globals import asteroid_file_suffix, ExpectationError
+from asteroid.globals import asteroid_file_suffix, ExpectationError, builtins
 from asteroid.lex import Lexer, token_lookup
 from asteroid.state import state, warning
 from asteroid.support import gettemp
@@ -80,6 +80,10 @@ class Parser:
     def __init__(self, filename="<input>", functional_mode=False):
         self.lexer = Lexer()
         self.functional_mode = functional_mode
+        # a return statement in a function body that is not nested in a
+        # try statement is in tail position, returning the value of a
+        # function call from there is a tail call.
+        self.tail_position = False
         self.system_modules = os.listdir(os.path.dirname( __file__ )+'/modules')
         self.parser_file_path = os.path.split(os.path.dirname(__file__))[0]
         state.lineinfo = (filename,1)
@@ -122,7 +126,6 @@ class Parser:
         sl = []
         while self.lexer.peek().type in stmt_lookahead:
             sl += [('lineinfo', state.lineinfo)]
-            sl += [('clear-ret-val',)]
             sl += [self.stmt()]
         return ('list', sl)
 
@@ -406,6 +409,9 @@ class Parser:
             if self.lexer.peek().type in exp_lookahead:
                 e = self.exp()
                 self.lexer.match_optional('DOT')
+                if self.tail_position and e[0] == 'apply' \
+                   and not (e[1][0] == 'id' and e[1][1] in builtins):
+                    return ('tail-call', e)
                 return ('return', e)
             else:
                 self.lexer.match_optional('DOT')
@@ -418,7 +424,10 @@ class Parser:
             catch_list = []
 
             self.lexer.match('TRY')
+            tail_position = self.tail_position
+            self.tail_position = False
             try_stmts = self.stmt_list()
+            self.tail_position = tail_position
             self.lexer.match('CATCH')
             dbg_print("parsing CATCH")
             pattern = self.pattern()
@@ -451,7 +460,7 @@ class Parser:
         elif tt in exp_lookahead:
             v = self.exp()
             self.lexer.match_optional('DOT')
-            return ('exp-stmt', ('set-ret-val', v))
+            return ('exp-stmt', v)
 
         else:
             raise SyntaxError("syntax error at '{}'"
@@ -551,6 +560,9 @@ class Parser:
         # a list of ('body', pattern, stmts) pairs
         body_list = []
 
+        tail_position = self.tail_position
+        self.tail_position = True
+
         cur_lineinfo = state.lineinfo
         self.lexer.match('WITH')
         p = self.pattern()
@@ -570,6 +582,7 @@ class Parser:
             body_list.append( ('lineinfo', cur_lineinfo) )
             body_list.append(('body', ('body-pattern', p), ('stmt-list', sl)))
 
+        self.tail_position = tail_position
         return ('body-list', ('list', body_list))
 
     ###########################################################################################
@@ -47,6 +47,25 @@ nullary_operators = {
 
 builtins = binary_operators | unary_operators | nullary_operators
 
+#########################################################################
+# shared values.  values are immutable, therefore the values computed
+# most often are allocated only once: the Boolean values, none, and like
+# in CPython the small integers from -5 to 256.  the value of the integer
+# n with -5 <= n <= 256 is small_integers[n+5].
+
+true_value = ('boolean', True)
+false_value = ('boolean', False)
+none_value = ('none', None)
+small_integers = [('integer', n) for n in range(-5, 257)]
+
+def boolean_value(b):
+    return true_value if b else false_value
+
+def integer_value(n):
+    if -5 <= n <= 256:
+        return small_integers[n+5]
+    return ('integer', n)
+
 #########################################################################
 # Use the exception mechanism to return values from function calls
 
@@ -58,6 +77,22 @@ class ReturnValue(Exception):
     def __str__(self):
         return(repr(self.value))
 
+#########################################################################
+# a return statement in tail position returns the value of a call, the
+# call is made by the caller of the returning function, see 'handle_call'
+
+class TailCall(ReturnValue):
+
+    def __init__(self, obj_ref, fval, args, fname):
+        self.value = None
+        self.obj_ref = obj_ref
+        self.fval = fval
+        self.args = args
+        self.fname = fname
+
+    def __str__(self):
+        return("tail call of '{}'".format(self.fname))
+
 #########################################################################
 class Break(Exception):
 
@@ -76,9 +111,20 @@ class ThrowValue(Exception):
         return(str(self.value))
 
 #########################################################################
+# the message is only formatted when it is needed, a failed match
+# is usually handled without ever looking at the message.
+
 class PatternMatchFailed(Exception):
-    def __init__(self, value):
-        self.value = "pattern match failed: " + value
+    def __init__(self, value, *args):
+        self.format = value
+        self.format_args = args
+
+    @property
+    def value(self):
+        if self.format_args:
+            return "pattern match failed: " + self.format.format(*self.format_args)
+        else:
+            return "pattern match failed: " + self.format
 
     def __str__(self):
         return(self.value)
@@ -155,6 +201,10 @@ unify_not_allowed = {
     'in',
 }
 
+# NOTE: functions/foreign are allowed in terms as long as they are matched
+# by a variable in the pattern
+unify_not_allowed_terms = unify_not_allowed - {'function-val', 'foreign'}
+
 ###########################################################################################
 # list of structures that constitute patterns
 
@@ -11,7 +11,10 @@ from asteroid.globals import *
 from asteroid.support import *
 from asteroid.frontend import Parser
 from asteroid.state import state, dump_trace
-from asteroid.walk import walk
+from asteroid.walk import engines, completed, program_value
+from asteroid.resolver import resolve
+import asteroid.compiler  # adds the 'compile' engine
+import asteroid.vm        # adds the 'vm' engine
 
 # the prologue file is expected to be in the 'modules' folder
 prologue_name = 'prologue.ast'
@@ -37,8 +40,9 @@ def load_prologue():
         pparser = Parser(prologue_file)
         pstmts = pparser.parse(data)
 
+    resolve(pstmts)
     state.AST = pstmts
-    walk(state.AST)
+    completed(engines[state.engine](state.AST))
     state.AST = None
 
 def interp(program,
@@ -52,7 +56,8 @@ def interp(program,
            debugger=None,
            functional_mode=False,
            warnings=True,
-           initialize_state = True
+           initialize_state = True,
+           engine = 'walk'
            ):
     '''
     The function 'interp' is the top-level entry point to the
@@ -71,12 +76,18 @@ def interp(program,
                          functional programming language.
       * warnings: if set will display warnings
       * initialize_state: if set then the interpreter will (re)initialize its state.  
+      * engine: the name of the execution engine, either 'walk' for the tree walker,
+                'compile' for the closure compiler, or 'vm' for the bytecode machine.
     '''
     try:
         # initialize state
         if initialize_state:
             state.initialize(program_name)
 
+        if engine not in engines:
+            raise ValueError("unknown execution engine '{}'".format(engine))
+        state.engine = engine
+
         if prologue:
             load_prologue()
 
@@ -87,6 +98,7 @@ def interp(program,
         # build the AST
         parser = Parser(program_name, functional_mode)
         stmts = parser.parse(program)
+        resolve(stmts)
         state.AST = stmts
         state.mainmodule = state.lineinfo[0]
 
@@ -100,7 +112,7 @@ def interp(program,
             debugger.start(state)
         if do_walk:
             try:
-                walk(state.AST)
+                program_value[0] = completed(engines[state.engine](state.AST))
                 if debugger: debugger.stop()
             except Exception as e:
                 if debugger: debugger.error(e)
@@ -0,0 +1,598 @@
+###########################################################################################
+# native implementations of Asteroid global functions and member functions
+#
+# (c) University of Rhode Island
+###########################################################################################
+
+import re
+
+from asteroid.globals import ThrowValue, boolean_value, integer_value
+from asteroid.support import term2string, data_only
+from asteroid.state import state
+from asteroid.packed import pack_range
+
+###########################################################################################
+# this dictionary maps the names of global functions to their Python implementations.
+# the prologue binds each of these names to a function value of the form
+#
+#       ('function-val', ('native', impl), closure)
+#
+# native functions are called directly on the evaluated argument value without
+# setting up an Asteroid stack frame.  a native function returns an Asteroid value
+# or the Python value None if none of its 'clauses' recognizes the argument.
+native_functions = dict()
+
+def native(name):
+    '''
+    decorator that enters a Python function into the native function table.
+    '''
+    def register(impl):
+        native_functions[name] = impl
+        return impl
+    return register
+
+###########################################################################################
+# this dictionary maps the names of the implementations of list and string member
+# functions, e.g. '__list_map__', to their Python implementations.  the prologue binds
+# each of these names to a function value of the form
+#
+#       ('function-val', ('native-member', impl), closure)
+#
+# a native member function is called like a native function but it is passed the
+# object reference as an additional first argument, impl(this_val, arg_val).
+native_members = dict()
+
+def native_member(name):
+    '''
+    decorator that enters a Python function into the native member function table.
+    '''
+    def register(impl):
+        native_members[name] = impl
+        return impl
+    return register
+
+###########################################################################################
+def throw_exception(kind, message):
+    '''
+    throw an Asteroid level Exception object with the given kind and message.
+    '''
+    (STRUCT,
+     (MEMBER_NAMES, (LIST, member_names)),
+     (STRUCT_MEMORY, (LIST, struct_memory))) = state.symbol_table.global_scope['Exception']
+    object_memory = struct_memory.copy()
+    object_memory[member_names.index('kind')] = ('string', kind)
+    object_memory[member_names.index('val')] = ('string', message)
+    raise ThrowValue(('object',
+                      ('struct-id', ('id', 'Exception')),
+                      ('member-names', ('list', member_names)),
+                      ('object-memory', ('list', object_memory))))
+
+###########################################################################################
+def integer_range(start, stop, step):
+    '''
+    the Python range of the Asteroid list [start to stop step step] where stop is inclusive.
+    '''
+    if step > 0:
+        return range(start, stop+1, step)
+    elif step < 0:
+        return range(start, stop-1, step)
+    else:
+        raise ValueError("step size of 0 not supported")
+
+###########################################################################################
+def integer_list(r):
+    '''
+    compute the Asteroid list of the integers in the Python range r.
+    '''
+    packed = pack_range(r)
+    if packed is None:
+        return ('list', [integer_value(i) for i in r])
+    return ('list', packed)
+
+###########################################################################################
+def arg_tuple(arg, types):
+    '''
+    if arg is a tuple whose components have exactly the given types then
+    return the Python values of the components otherwise return None.
+    '''
+    if arg[0] != 'tuple' or len(arg[1]) != len(types):
+        return None
+    for (component, type) in zip(arg[1], types):
+        if component[0] != type:
+            return None
+    return [v for (_, v) in arg[1]]
+
+###########################################################################################
+@native('len')
+def native_len(item):
+    if item[0] in ['list','tuple','string']:
+        return integer_value(len(item[1]))
+    elif item[0] == 'object':
+        (OBJECT,
+         (STRUCT_ID, (ID, name)),
+         (MEMBER_NAMES, (LIST, member_names)),
+         (OBJECT_MEMORY, (LIST, object_memory))) = item
+        return integer_value(len(data_only(object_memory)))
+    elif item[0] == 'struct':
+        (STRUCT,
+         (MEMBER_NAMES, (LIST, member_names)),
+         (STRUCT_MEMORY, (LIST, struct_memory))) = item
+        return integer_value(len(data_only(struct_memory)))
+    else:
+        raise ValueError(
+            'len expected a list, tuple, string, or structure got \'{}\''
+            .format(item[0]))
+
+###########################################################################################
+@native('hd')
+def native_hd(l):
+    # return the first element of a list, error if list is empty
+    if l[0] != 'list':
+        return None
+    elif not l[1]:
+        throw_exception("ValueError", "empty list not supported")
+    else:
+        return l[1][0]
+
+###########################################################################################
+@native('tl')
+def native_tl(l):
+    # return the rest of the list without the first element
+    if l[0] != 'list':
+        return None
+    elif not l[1]:
+        throw_exception("ValueError", "empty list not supported")
+    else:
+        return ('list', l[1][1:])
+
+###########################################################################################
+def range_args(arg):
+    '''
+    the Python range denoted by the argument of 'range', None if the argument
+    is not recognized.
+    '''
+    if arg[0] == 'integer':
+        return integer_range(0, arg[1]-1, 1)
+    vals = arg_tuple(arg, ['integer','integer'])
+    if vals:
+        (start, stop) = vals
+        return integer_range(start, stop-1, 1)
+    vals = arg_tuple(arg, ['integer','integer','integer'])
+    if vals:
+        (start, stop, inc) = vals
+        return integer_range(start, stop-1, inc)
+    return None
+
+@native('range')
+def native_range(arg):
+    r = range_args(arg)
+    if r is None:
+        return None
+    return integer_list(r)
+
+###########################################################################################
+@native('getid')
+def native_getid(x):
+    # get the id (physical memory address) of 'x' as an Asteroid integer
+    return ('integer', id(x))
+
+###########################################################################################
+@native('isdefined')
+def native_isdefined(x):
+    # return true if a variable or type name is defined in the
+    # current environment otherwise return false
+    # NOTE: like the Asteroid function this replaces, the name is looked up in the
+    # global scope of the program where isdefined is defined and not in the scope of
+    # the caller.  '__x__', the parameter of that function, is always defined.
+    if x[0] != 'string':
+        return None
+    scope = state.symbol_table.scope
+    while scope.parent:
+        scope = scope.parent
+    if x[1] == '__x__' or x[1] in scope.symbols:
+        return ('boolean', True)
+    else:
+        return ('boolean', False)
+
+###########################################################################################
+# type conversion functions
+
+@native('tobase')
+def native_tobase(arg):
+    # represent the given integer x as a numeral in different bases
+    vals = arg_tuple(arg, ['integer','integer'])
+    if not vals:
+        return None
+    (x, base) = vals
+    if base == 2:
+        return ('string', format(x,'b'))
+    elif base == 8:
+        return ('string', format(x,'o'))
+    elif base == 16:
+        return ('string', format(x,'X'))
+    else:
+        raise ValueError('illegal base value {}'.format(base))
+
+@native('tointeger')
+def native_tointeger(item):
+    vals = arg_tuple(item, ['string','integer'])
+    if vals:
+        (s, base) = vals
+        return integer_value(int(s, base=base))
+    else:
+        return integer_value(int(item[1]))
+
+@native('toreal')
+def native_toreal(item):
+    return ('real', float(item[1]))
+
+###########################################################################################
+def format_spec(f):
+    '''
+    if f is a __STRINGFORMAT__ object return the Python values of
+    its data members (length, precision, scientific) otherwise return None.
+    '''
+    if f[0] != 'object' or f[1][1][1] != '__STRINGFORMAT__':
+        return None
+    (OBJECT,
+     (STRUCT_ID, (ID, struct_id)),
+     (MEMBER_NAMES, (LIST, member_names)),
+     (OBJECT_MEMORY, (LIST, object_memory))) = f
+    return data_only(object_memory)
+
+@native('tostring')
+def native_tostring(arg):
+    # convert an asteroid object to string.
+    # if format values are given apply the
+    # formatting to the object.
+    if arg[0] == 'tuple' and len(arg[1]) == 2:
+        (v, f) = arg[1]
+        spec = format_spec(f)
+        if spec:
+            (w, p, s) = spec
+            if v[0] in ['boolean','integer','string'] \
+            and w[0] == 'integer' and p[0] == 'none' and s[0] == 'none':
+                # right justified, if width spec is too narrow it is ignored.
+                vs = term2string(v)
+                return ('string', vs.rjust(w[1]))
+            elif v[0] == 'real' and w[0] == 'integer' and p[0] == 'none' and s[0] == 'none':
+                # left justified with zero padding on the right.
+                fmtstr = '{:'+str(w[1])+'f}'
+                return ('string', fmtstr.format(v[1]))
+            elif v[0] == 'real' and w[0] == 'integer' and p[0] == 'integer' and s[0] == 'none':
+                fmtstr = '{:'+str(w[1])+'.'+str(p[1])+'f}'
+                return ('string', fmtstr.format(v[1]))
+            elif v[0] == 'real' and w[0] == 'integer' and p[0] == 'integer' and s[0] == 'boolean':
+                fmtstr = '{:'+str(w[1])+'.'+str(p[1])+('e}' if s[1] else 'f}')
+                return ('string', fmtstr.format(v[1]))
+    # default clause
+    return ('string', term2string(arg))
+
+###########################################################################################
+# type query functions
+
+@native('islist')
+def native_islist(item):
+    return boolean_value(item[0] == 'list')
+
+@native('isnone')
+def native_isnone(x):
+    return boolean_value(x[0] == 'none')
+
+@native('isscalar')
+def native_isscalar(item):
+    return boolean_value(item[0] in ['integer','real'])
+
+@native('gettype')
+def native_gettype(x):
+    # get the type of 'x' as an Asteroid string
+    if x[0] == 'object':
+        (OBJECT, (STRUCT_ID, (ID, x_type)), MEMBER_LIST, OBJECT_MEMORY) = x
+    elif x[0] in ['function-val','member-function-val']:
+        # internally we store functions as function values
+        # but to the user these look like functions as the
+        # type counter part to the %function type pattern
+        # will match both function-val and member-function-val
+        x_type = 'function'
+    else:
+        x_type = x[0]
+    return ('string', x_type)
+
+###########################################################################################
+# calling Asteroid functions from native code.  the function value is called directly
+# through 'handle_call', e.g. the order predicate of a sort.
+
+def call_function(fval, arg_val, fname):
+    '''
+    call the Asteroid function or member function value fval with the argument
+    value arg_val.
+    '''
+    from asteroid.walk import handle_call
+    if fval[0] == 'member-function-val':
+        (MEMBER_FUNCTION_VAL, obj_ref, function_val) = fval
+        return handle_call(obj_ref, function_val, arg_val, fname)
+    return handle_call(None, fval, arg_val, fname)
+
+def is_function(val):
+    '''
+    true if val is matched by the type pattern %function.
+    '''
+    return val[0] in ['function-val', 'member-function-val']
+
+def call_predicate(fval, arg_val, fname):
+    '''
+    call an Asteroid function value that has to return a Boolean and return the
+    Python truth value.
+    '''
+    result = call_function(fval, arg_val, fname)
+    if result[0] != 'boolean':
+        raise ValueError("function '{}' has to return a Boolean".format(fname))
+    return result[1]
+
+###########################################################################################
+# sorting.  Python sorts are stable and only compare with '<', the sort key of a value
+# implements '<' with an Asteroid order predicate the way functools.cmp_to_key implements
+# it with a comparison function.
+
+class PredicateKey:
+    __slots__ = ('value', 'less')
+
+    def __init__(self, value, less):
+        self.value = value
+        self.less = less
+
+    def __lt__(self, other):
+        return self.less(self.value, other.value)
+
+def sort_values(p_val, values):
+    '''
+    the list of the values sorted with the Asteroid order predicate p_val, p(x,y)
+    is true if x has to come before y.
+    '''
+    less = lambda x, y: call_predicate(p_val, ('tuple', [x, y]), 'p')
+    return [key.value for key in sorted([PredicateKey(value, less) for value in values])]
+
+def sort_values_by(keyfn_val, values):
+    '''
+    the list of the values sorted by the keys computed by the Asteroid function
+    keyfn_val, the key of each value is computed once.  the keys are ordered with
+    the '<' operator.
+    '''
+    keys = [call_function(keyfn_val, value, 'keyfn') for value in values]
+    types = {key[0] for key in keys}
+    if len(types) == 1 and types <= {'integer', 'real', 'string'}:
+        # the keys are ordered like their Python values
+        python_keys = [key[1] for key in keys]
+    else:
+        from asteroid.walk import builtin_lt
+        less = lambda x, y: builtin_lt(x, y)[1]
+        python_keys = [PredicateKey(key, less) for key in keys]
+    order = sorted(range(len(values)), key=python_keys.__getitem__)
+    return [values[i] for i in order]
+
+###########################################################################################
+# list member functions
+
+@native_member('__list_map__')
+def native_list_map(this, f):
+    # apply f to each element of the list
+    if not is_function(f):
+        return None
+    return ('list', [call_function(f, e, 'f') for e in this[1]])
+
+@native_member('__list_filter__')
+def native_list_filter(this, f):
+    # construct an output list from those elements of the list for which f returns true
+    if not is_function(f):
+        return None
+    out = []
+    for e in this[1]:
+        r = call_function(f, e, 'f')
+        if r[0] != 'boolean':
+            raise ValueError('list filter function has to return a Boolean')
+        if r[1]:
+            out.append(e)
+    return ('list', out)
+
+@native_member('__list_reduce__')
+def native_list_reduce(this, arg):
+    # Note: first arg to f is the accumulator
+    if is_function(arg):
+        f = arg
+        # NOTE: reducing an empty list without an initial value is an index error
+        value = this[1][0]
+        elements = this[1][1:]
+    elif arg[0] == 'tuple' and len(arg[1]) == 2 and is_function(arg[1][0]):
+        (f, value) = arg[1]
+        elements = this[1]
+    else:
+        return None
+    for e in elements:
+        value = call_function(f, ('tuple', [value, e]), 'f')
+    return value
+
+@native_member('__list_copy__')
+def native_list_copy(this, arg):
+    # make a shallow copy of the list
+    if arg[0] != 'none':
+        return None
+    return ('list', this[1].copy())
+
+@native_member('__list_member__')
+def native_list_member(this, item):
+    return boolean_value(item in this[1])
+
+###########################################################################################
+# string member functions
+
+def string_list(strings):
+    '''
+    the Asteroid list of the Python strings.
+    '''
+    return ('list', [('string', s) for s in strings])
+
+def loc_indices(val):
+    '''
+    if val is a loc object then return the Python values of its start and end index,
+    the end index is None if it is not given, otherwise return None.
+    '''
+    if val[0] != 'object' or val[1] != ('struct-id', ('id', 'loc')):
+        return None
+    (OBJECT,
+     (STRUCT_ID, (ID, struct_id)),
+     (MEMBER_NAMES, (LIST, member_names)),
+     (OBJECT_MEMORY, (LIST, memory))) = val
+    startix = memory[member_names.index('startix')]
+    endix = memory[member_names.index('endix')]
+    if startix[0] != 'integer' or endix[0] not in ['integer', 'none']:
+        return None
+    return (startix[1], endix[1])
+
+def search_args(arg):
+    '''
+    the Python arguments of the string search functions for the Asteroid argument
+    item:%string | (item:%string, loc(startix:%integer)) | (item:%string, loc(startix:%integer, endix:%integer)),
+    None if the argument is not recognized.
+    '''
+    if arg[0] == 'string':
+        return [arg[1]]
+    elif arg[0] == 'tuple' and len(arg[1]) == 2 and arg[1][0][0] == 'string':
+        indices = loc_indices(arg[1][1])
+        if indices is None:
+            return None
+        (startix, endix) = indices
+        if endix is None:
+            return [arg[1][0][1], startix]
+        return [arg[1][0][1], startix, endix]
+    else:
+        return None
+
+def affix_args(arg):
+    '''
+    the Python argument of startswith and endswith, a string or a tuple of strings
+    given as a list of strings, None if the argument is not recognized.
+    '''
+    if arg[0] == 'string':
+        return arg[1]
+    elif arg[0] == 'list' and all(e[0] == 'string' for e in arg[1]):
+        return tuple(s for (_, s) in arg[1])
+    else:
+        return None
+
+@native_member('__string_length__')
+def native_string_length(this, arg):
+    if arg[0] != 'none':
+        return None
+    return integer_value(len(this[1]))
+
+@native_member('__string_explode__')
+def native_string_explode(this, arg):
+    if arg[0] != 'none':
+        return None
+    return string_list(this[1])
+
+@native_member('__string_trim__')
+def native_string_trim(this, what):
+    # Return a copy of the string with the leading and trailing characters in what removed.
+    if what[0] == 'none':
+        return ('string', this[1].strip())
+    elif what[0] == 'string':
+        return ('string', this[1].strip(what[1]))
+    else:
+        return None
+
+@native_member('__string_replace__')
+def native_string_replace(this, arg):
+    # Return a copy of the string with all occurrences of regular expression pattern
+    # old replaced by the string new. If the optional argument count is given,
+    # only the first count occurrences are replaced.
+    args = arg_tuple(arg, ['string', 'string', 'integer']) \
+           or arg_tuple(arg, ['string', 'string'])
+    if args is None:
+        return None
+    (old, new, *count) = args
+    return ('string', re.sub(old, new, this[1], *count))
+
+@native_member('__string_split__')
+def native_string_split(this, arg):
+    # Return a list of the words in the string, using sep as the delimiter string,
+    # at most count splits are done if count is given.
+    if arg[0] == 'none':
+        return string_list(this[1].split())
+    elif arg[0] == 'string':
+        return string_list(this[1].split(arg[1]))
+    args = arg_tuple(arg, ['string', 'integer'])
+    if args is None:
+        return None
+    return string_list(this[1].split(*args))
+
+@native_member('__string_toupper__')
+def native_string_toupper(this, arg):
+    if arg[0] != 'none':
+        return None
+    return ('string', this[1].upper())
+
+@native_member('__string_tolower__')
+def native_string_tolower(this, arg):
+    if arg[0] != 'none':
+        return None
+    return ('string', this[1].lower())
+
+@native_member('__string_index__')
+@native_member('__string_find__')
+def native_string_index(this, arg):
+    # the index of item in the string or -1 if it was not found
+    args = search_args(arg)
+    if args is None:
+        return None
+    return integer_value(this[1].find(*args))
+
+@native_member('__string_flip__')
+def native_string_flip(this, arg):
+    if arg[0] != 'none':
+        return None
+    return ('string', this[1][::-1])
+
+@native_member('__string_startswith__')
+def native_string_startswith(this, prefix):
+    prefix = affix_args(prefix)
+    if prefix is None:
+        return None
+    return boolean_value(this[1].startswith(prefix))
+
+@native_member('__string_endswith__')
+def native_string_endswith(this, suffix):
+    suffix = affix_args(suffix)
+    if suffix is None:
+        return None
+    return boolean_value(this[1].endswith(suffix))
+
+@native_member('__string_count__')
+def native_string_count(this, arg):
+    # the number of non-overlapping occurrences of item in the string
+    args = search_args(arg)
+    if args is None:
+        return None
+    return integer_value(this[1].count(*args))
+
+@native_member('__string_splitlines__')
+def native_string_splitlines(this, keepends):
+    # the lines of the string, with the line breaks if keepends is true
+    if keepends[0] == 'none':
+        return string_list(this[1].splitlines())
+    elif keepends[0] == 'boolean':
+        return string_list(this[1].splitlines(keepends[1]))
+    else:
+        return None
+
+@native_member('__string_join__')
+def native_string_join(this, strings):
+    # concatenate a list of strings with the string as the separator
+    if strings[0] != 'list':
+        return None
+    raw_list = []
+    for (t,v) in strings[1]:
+        if t != 'string':
+            raise ValueError('join: string list only')
+        raw_list.append(v)
+    return ('string', this[1].join(raw_list))
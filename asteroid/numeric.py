@@ -0,0 +1,281 @@
+#########################################################################
+# numeric lists as NumPy arrays
+#
+# a list whose values are all integers or all reals is computed on as a
+# whole: the Python values of the list are converted into a NumPy array,
+# one NumPy call computes the result, and the result is converted back
+# into a list.  the results are exactly the results of applying the
+# Asteroid operators element by element:
+#
+#   - integers are computed with machine integers only if no result can
+#     overflow, otherwise with the Python integers in an array of objects.
+#   - sums of reals are computed from left to right like the reduction
+#     of the list with '+'.
+#   - lists of other values, operands of different types, and divisions
+#     by zero are computed element by element with the Asteroid operators
+#     which also raise the errors.
+#
+# (c) University of Rhode Island
+#########################################################################
+
+import math
+import numpy
+from functools import reduce
+
+from asteroid.globals import integer_value
+from asteroid.packed import PackedList, pack_values, python_values, type_codes, max_integer
+from asteroid.walk import builtin_plus, builtin_minus, builtin_times, builtin_divide
+
+#########################################################################
+def numeric_type(values):
+    '''
+    'integer' or 'real' if all the values of the list have that type,
+    None otherwise.
+    '''
+    if values.__class__ is PackedList:
+        return values.type
+    if not values:
+        return None
+    type = values[0][0]
+    if type not in type_codes:
+        return None
+    for value in values:
+        if value[0] != type:
+            return None
+    return type
+
+#########################################################################
+def to_array(type, values):
+    '''
+    the NumPy array of the Python values of a list of values of the given
+    numeric type.  integers that do not fit into machine integers are kept
+    in an array of objects.
+    '''
+    if values.__class__ is PackedList:
+        return numpy.array(values.array)
+    python_values = [value[1] for value in values]
+    if type == 'real':
+        return numpy.array(python_values, dtype=numpy.float64)
+    try:
+        return numpy.array(python_values, dtype=numpy.int64)
+    except OverflowError:
+        return numpy.array(python_values, dtype=object)
+
+#########################################################################
+def values_list(type, values):
+    '''
+    the Asteroid list of the Python values of the given numeric type.
+    '''
+    packed = pack_values(type, values)
+    if packed is not None:
+        return ('list', packed)
+    elif type == 'integer':
+        return ('list', [integer_value(n) for n in values])
+    else:
+        return ('list', [('real', x) for x in values])
+
+def to_list(type, array):
+    '''
+    the Asteroid list of the values of the given numeric type in the NumPy
+    array.
+    '''
+    return values_list(type, array.tolist())
+
+#########################################################################
+def magnitude(x):
+    '''
+    the largest magnitude of the integers in the NumPy array or of the
+    Python integer x.
+    '''
+    if x.__class__ is not numpy.ndarray:
+        return abs(x)
+    elif len(x) == 0:
+        return 0
+    else:
+        # NOTE: the magnitude of the smallest machine integer is not a
+        # machine integer, compute it with Python integers.
+        return max(-int(x.min()), int(x.max()))
+
+def exact(x):
+    '''
+    the NumPy array x computed on with Python integers.
+    '''
+    if x.__class__ is numpy.ndarray:
+        return x.astype(object)
+    return x
+
+#########################################################################
+def operand(val):
+    '''
+    the pair (type, x) of an operand of a vector operation where x is the
+    NumPy array of a numeric list or the Python value of a scalar.  the
+    type is None if the operand is a list of other values.
+    '''
+    if val[0] == 'list':
+        type = numeric_type(val[1])
+        if type is None:
+            return (None, None)
+        return (type, to_array(type, val[1]))
+    return val
+
+def element_by_element(operator, a_val, b_val):
+    '''
+    apply the Python implementation of an Asteroid operator to the elements
+    of two lists of the same length or of a list and a scalar.
+    '''
+    if a_val[0] == 'list' and b_val[0] == 'list':
+        pairs = zip(a_val[1], b_val[1])
+    elif a_val[0] == 'list':
+        pairs = ((x, b_val) for x in a_val[1])
+    else:
+        pairs = ((a_val, y) for y in b_val[1])
+    return ('list', [operator(x, y) for (x, y) in pairs])
+
+#########################################################################
+# the vector operations.  each operation is the Asteroid operator applied
+# element by element, the NumPy functions computing it for integers and
+# reals, and the bound of the magnitudes of the integer results given the
+# bounds of the magnitudes of the operands.
+vector_operations = {
+    'add'  : (builtin_plus,   numpy.add,          numpy.add,         lambda m, n: m + n),
+    'sub'  : (builtin_minus,  numpy.subtract,     numpy.subtract,    lambda m, n: m + n),
+    'mult' : (builtin_times,  numpy.multiply,     numpy.multiply,    lambda m, n: m * n),
+    'div'  : (builtin_divide, numpy.floor_divide, numpy.true_divide, lambda m, n: m),
+}
+
+def elementwise(name, a_val, b_val):
+    '''
+    the vector operation 'name' on two lists of the same length or on a
+    list and a scalar.
+    '''
+    (operator, integer_function, real_function, bound) = vector_operations[name]
+    (a_type, a) = operand(a_val)
+    (b_type, b) = operand(b_val)
+
+    if a_type is None or a_type != b_type \
+       or (operator is builtin_divide and numpy.any(b == 0)):
+        return element_by_element(operator, a_val, b_val)
+    elif a_type == 'integer':
+        if bound(magnitude(a), magnitude(b)) > max_integer:
+            (a, b) = (exact(a), exact(b))
+        return to_list('integer', integer_function(a, b))
+    else:
+        return to_list('real', real_function(a, b))
+
+#########################################################################
+def sum_array(type, array):
+    '''
+    the Asteroid value of the sum of a nonempty NumPy array of the given
+    numeric type.
+    '''
+    if type == 'integer':
+        if magnitude(array) * len(array) > max_integer:
+            array = exact(array)
+        return integer_value(int(array.sum()))
+    else:
+        # the last partial sum is the sum computed from left to right
+        return ('real', float(numpy.cumsum(array)[-1]))
+
+def sum_values(values):
+    '''
+    the sum of the values of a list, the reduction of the list with '+'.
+    '''
+    if not values:
+        # like the reduction of an empty list
+        raise IndexError("list index out of range")
+    type = numeric_type(values)
+    if type is None:
+        return reduce(builtin_plus, values)
+    return sum_array(type, to_array(type, values))
+
+def dot(a_val, b_val):
+    '''
+    the dot product of two lists of the same length, the sum of the
+    element by element products.
+    '''
+    a_type = numeric_type(a_val[1])
+    if a_type is None or a_type != numeric_type(b_val[1]):
+        return sum_values(element_by_element(builtin_times, a_val, b_val)[1])
+
+    a = to_array(a_type, a_val[1])
+    b = to_array(a_type, b_val[1])
+    if a_type == 'integer' and magnitude(a) * magnitude(b) > max_integer:
+        (a, b) = (exact(a), exact(b))
+    return sum_array(a_type, a * b)
+
+#########################################################################
+# the math functions applied to all the elements of a list.  each name
+# maps to the Python function computing the scalar math function of the
+# math module and the type of its results, None if the result has the
+# type of the argument.
+math_functions = {
+    'exp'     : (math.exp,       'real'),
+    'log'     : (math.log,       'real'),
+    'sqrt'    : (math.sqrt,      'real'),
+    'isqrt'   : (math.isqrt,     'integer'),
+    'expm1'   : (math.expm1,     'real'),
+    'log1p'   : (math.log1p,     'real'),
+    'log2'    : (math.log2,      'real'),
+    'log10'   : (math.log10,     'real'),
+    'abs'     : (abs,            None),
+    'ceil'    : (math.ceil,      'integer'),
+    'floor'   : (math.floor,     'integer'),
+    'round'   : (round,          'integer'),
+    'trunc'   : (math.trunc,     'integer'),
+    'factorial' : (math.factorial, 'integer'),
+    'acos'    : (math.acos,      'real'),
+    'asin'    : (math.asin,      'real'),
+    'atan'    : (math.atan,      'real'),
+    'cos'     : (math.cos,       'real'),
+    'sin'     : (math.sin,       'real'),
+    'tan'     : (math.tan,       'real'),
+    'acosh'   : (math.acosh,     'real'),
+    'asinh'   : (math.asinh,     'real'),
+    'atanh'   : (math.atanh,     'real'),
+    'cosh'    : (math.cosh,      'real'),
+    'sinh'    : (math.sinh,      'real'),
+    'tanh'    : (math.tanh,      'real'),
+    'degrees' : (math.degrees,   'real'),
+    'radians' : (math.radians,   'real'),
+    'erf'     : (math.erf,       'real'),
+    'erfc'    : (math.erfc,      'real'),
+    'gamma'   : (math.gamma,     'real'),
+    'lgamma'  : (math.lgamma,    'real'),
+}
+
+def apply_math(name, values):
+    '''
+    apply the math function 'name' to all the values of a list in a single
+    pass.  the NumPy square root and absolute value are correctly rounded
+    like their Python counterparts and are used on numeric lists, all other
+    functions are applied with the Python function of the scalar math
+    function so that the results and errors are exactly the same.
+    '''
+    if name not in math_functions:
+        raise ValueError("unknown math function '{}'".format(name))
+    (function, type) = math_functions[name]
+    arg_type = numeric_type(values)
+
+    if arg_type is None:
+        for value in values:
+            if value[0] not in type_codes:
+                raise ValueError("unsupported type '{}' for {}"
+                                 .format(value[0], name))
+        if type is None:
+            return ('list', [(value[0], function(value[1])) for value in values])
+
+    array = None
+    if arg_type is not None and name in ['sqrt', 'abs']:
+        array = to_array(arg_type, values)
+        if array.dtype == object \
+           or (name == 'sqrt' and numpy.any(array < 0)) \
+           or (name == 'abs' and magnitude(array) > max_integer):
+            array = None
+
+    if array is None:
+        return values_list(type or arg_type,
+                           list(map(function, python_values(values))))
+    elif name == 'sqrt':
+        return to_list('real', numpy.sqrt(array))
+    else:
+        return to_list(arg_type, numpy.abs(array))
@@ -0,0 +1,293 @@
+#########################################################################
+# packed numeric lists
+#
+# the memory of an Asteroid list is a Python list of values, a list of
+# integers is a Python list of ('integer', n) tuples.  large lists of
+# integers or reals are stored much more compactly in an array of
+# machine numbers.  a packed list is a Python list whose elements are
+# kept in an array instead, it behaves exactly like the list of values
+# it stands for: reading an element produces the value tuple, and any
+# code that works on the memory of an Asteroid list works on a packed
+# list without knowing about it.
+#
+# writing a value that does not fit the array, e.g. a string into a list
+# of integers, unpacks the list in place into an ordinary list of values
+# and from then on the list is just a Python list.
+#
+# (c) University of Rhode Island
+#########################################################################
+
+from array import array
+from operator import itemgetter
+
+#########################################################################
+# the array type codes of the packable value types
+type_codes = {
+    'integer' : 'q',
+    'real'    : 'd',
+}
+
+# the range of the machine integers of an 'q' array
+min_integer = -2**63
+max_integer = 2**63 - 1
+
+# lists shorter than this are not worth packing
+min_packed_length = 64
+
+#########################################################################
+def packable(type, n):
+    '''
+    return true if the Python value n of an Asteroid value of the given
+    type can be stored in a packed list of that type.
+    '''
+    if type == 'integer':
+        return n.__class__ is int and min_integer <= n <= max_integer
+    else:
+        return n.__class__ is float
+
+#########################################################################
+def pack_range(r):
+    '''
+    the packed list of the integers in the Python range r, None if the
+    range is too short or its integers do not fit into machine integers.
+    '''
+    if len(r) < min_packed_length \
+       or not min_integer <= min(r[0], r[-1]) \
+       or not max(r[0], r[-1]) <= max_integer:
+        return None
+    return PackedList('integer', array('q', r))
+
+#########################################################################
+def pack_values(type, values):
+    '''
+    the packed list of the Python values of the given Asteroid type, None
+    if the list is too short or some value cannot be packed.
+    '''
+    if len(values) < min_packed_length:
+        return None
+    for n in values:
+        if not packable(type, n):
+            return None
+    return PackedList(type, array(type_codes[type], values))
+
+#########################################################################
+def python_values(values):
+    '''
+    an iterable over the Python values of a list of values, the array of a
+    packed list.
+    '''
+    if values.__class__ is PackedList:
+        return values.array
+    return map(itemgetter(1), values)
+
+#########################################################################
+class PackedList(list):
+    '''
+    a list of Asteroid values of type 'integer' or 'real' whose Python
+    values are stored in an array.
+    NOTE: the storage of the Python list itself stays empty, every list
+    operation is implemented on the array.
+    '''
+    __slots__ = ('type', 'array')
+
+    def __init__(self, type, values):
+        self.type = type
+        self.array = values
+
+    ###################################################################
+    # switch to the ordinary list of values.  the object changes its
+    # class to UnpackedList which is just a Python list.
+    def unpack(self):
+        values = self.values()
+        self.array = None
+        self.__class__ = UnpackedList
+        self.extend(values)
+
+    def values(self):
+        type = self.type
+        return [(type, n) for n in self.array]
+
+    def matches(self, value):
+        # values of the type of the list compare like their Python values
+        return value.__class__ is tuple \
+            and len(value) == 2 \
+            and value[0] == self.type
+
+    def accepts(self, value):
+        return self.matches(value) and packable(self.type, value[1])
+
+    ###################################################################
+    # reading
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        type = self.type
+        return ((type, n) for n in self.array)
+
+    def __reversed__(self):
+        type = self.type
+        return ((type, n) for n in reversed(self.array))
+
+    def __getitem__(self, ix):
+        if ix.__class__ is slice:
+            type = self.type
+            return [(type, n) for n in self.array[ix]]
+        try:
+            return (self.type, self.array[ix])
+        except IndexError:
+            raise IndexError("list index out of range")
+        except TypeError:
+            raise TypeError("list indices must be integers or slices, not {}"
+                            .format(ix.__class__.__name__))
+
+    def __contains__(self, value):
+        return self.matches(value) and value[1] in self.array
+
+    def index(self, value, *args):
+        return self.values().index(value, *args)
+
+    def count(self, value):
+        if self.matches(value):
+            return self.array.count(value[1])
+        return 0
+
+    def copy(self):
+        return PackedList(self.type, array(self.array.typecode, self.array))
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __reduce__(self):
+        return (PackedList, (self.type, self.array))
+
+    def __repr__(self):
+        return repr(self.values())
+
+    ###################################################################
+    # comparison and arithmetic work on the list of values
+    def __eq__(self, other):
+        if other.__class__ is PackedList and other.type == self.type:
+            return self.array == other.array
+        return self.values() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return self.values() < other
+
+    def __le__(self, other):
+        return self.values() <= other
+
+    def __gt__(self, other):
+        return self.values() > other
+
+    def __ge__(self, other):
+        return self.values() >= other
+
+    __hash__ = None
+
+    def __add__(self, other):
+        if other.__class__ is PackedList and other.type == self.type:
+            return PackedList(self.type, self.array + other.array)
+        return self.values() + other
+
+    def __radd__(self, other):
+        return other + self.values()
+
+    def __mul__(self, n):
+        return self.values() * n
+
+    __rmul__ = __mul__
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, n):
+        self.unpack()
+        return list.__imul__(self, n)
+
+    ###################################################################
+    # writing, values that cannot be packed unpack the list
+    def __setitem__(self, ix, value):
+        if ix.__class__ is not slice and self.accepts(value):
+            try:
+                self.array[ix] = value[1]
+            except IndexError:
+                raise IndexError("list assignment index out of range")
+        else:
+            self.unpack()
+            self[ix] = value
+
+    def __delitem__(self, ix):
+        try:
+            del self.array[ix]
+        except IndexError:
+            raise IndexError("list assignment index out of range")
+
+    def append(self, value):
+        if self.accepts(value):
+            self.array.append(value[1])
+        else:
+            self.unpack()
+            self.append(value)
+
+    def extend(self, values):
+        if values.__class__ is PackedList and values.type == self.type:
+            self.array.extend(values.array)
+            return
+        values = list(values)
+        if all(self.accepts(value) for value in values):
+            self.array.extend(value[1] for value in values)
+        else:
+            self.unpack()
+            self.extend(values)
+
+    def insert(self, ix, value):
+        if self.accepts(value):
+            self.array.insert(ix, value[1])
+        else:
+            self.unpack()
+            self.insert(ix, value)
+
+    def remove(self, value):
+        if value in self:
+            self.array.remove(value[1])
+        else:
+            raise ValueError("list.remove(x): x not in list")
+
+    def pop(self, ix=-1):
+        if not self.array:
+            raise IndexError("pop from empty list")
+        try:
+            return (self.type, self.array.pop(ix))
+        except IndexError:
+            raise IndexError("pop index out of range")
+
+    def clear(self):
+        self.array = array(self.array.typecode)
+
+    def sort(self, *, key=None, reverse=False):
+        if key is None:
+            # the values all have the same type, they are ordered by
+            # their Python values.
+            self.array = array(self.array.typecode,
+                               sorted(self.array, reverse=reverse))
+        else:
+            self.unpack()
+            self.sort(key=key, reverse=reverse)
+
+    def reverse(self):
+        self.array.reverse()
+
+#########################################################################
+class UnpackedList(list):
+    '''
+    a packed list after it has been unpacked, the layout has to be the
+    layout of a packed list.
+    '''
+    __slots__ = ('type', 'array')
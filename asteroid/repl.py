@@ -8,7 +8,7 @@ from asteroid.interp import interp, load_prologue
 from asteroid.version import VERSION
 from asteroid.state import state
 from asteroid.globals import ExpectationError
-from asteroid.walk import function_return_value
+from asteroid.walk import program_value
 from asteroid.support import term2string
 
 from sys import stdin,exit
@@ -101,14 +101,14 @@ def run_repl(redundancy, functional_mode):
             line = ""
 
             # Check for return value
-            if function_return_value[-1]:
+            if program_value[0]:
                 # Get the last return value (type, value)
-                retval = function_return_value[-1]
+                retval = program_value[0]
                 # If it isn't none, print out the value
                 if retval[1] != None:
-                    print(term2string(function_return_value[-1]))
+                    print(term2string(program_value[0]))
                     # Reset the return value
-                    function_return_value[0] = None
+                    program_value[0] = None
 
         except ExpectationError as e:
             # If we expected something but found EOF, it's a continue
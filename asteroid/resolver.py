@@ -0,0 +1,269 @@
+#########################################################################
+# lexical addressing for Asteroid programs
+#
+# variables are bound by pattern matching at run time, therefore in
+# general a variable reference has to be looked up by scanning the
+# scopes of the symbol table from the innermost scope outwards.  this
+# pass resolves variable references ahead of time where the scope that
+# holds the variable is statically known.  a function body is executed
+# in its own scope at depth 0 whose parent scopes are the scopes of the
+# closure, that is, the scopes of the enclosing function bodies.  for
+# the scope of each function clause body we compute,
+#
+#   * definite: the variables of the pattern of a function clause, these
+#               are bound in the function scope before the clause body runs.
+#   * maybe:    every variable that appears in a pattern anywhere in the
+#               function body.
+#
+# a reference to 'x' is resolved by walking outwards over the enclosing
+# function bodies: if 'x' is definitely bound at depth d the reference is
+# resolved to the slot 'x' of the scope at depth d, if it may be bound at
+# depth d the lookup has to scan the scopes starting at depth d.  scopes
+# in which 'x' can never be bound are skipped.
+#
+# function bodies that use 'global', 'eval', 'escape', 'load', or
+# first-class patterns can bind arbitrary variables, resolution stops at
+# such a function body and the lookup scans from there.
+#
+# (c) University of Rhode Island
+#########################################################################
+
+from asteroid.support import NodeCache
+
+#########################################################################
+# the addresses of resolved variable references.  the table maps an 'id'
+# node to a pair (kind, depth) where kind is either
+#
+#   'slot': the variable is bound in the scope at the given depth
+#   'scan': the variable has to be looked up starting at the given depth
+#
+# references that are not in the table are looked up by scanning from
+# depth 0.  the table is a bounded cache, see 'NodeCache' in support.py,
+# a full table is only emptied before a program is resolved and never
+# while a program is resolved.
+# NOTE: the parser can share nodes between contexts, a node that resolves
+# differently in different contexts is looked up by scanning from depth 0.
+addresses = NodeCache(2**16)
+
+#########################################################################
+class Frame:
+    '''
+    static information about the scope of a function clause body.
+    '''
+    def __init__(self, definite, maybe, dynamic):
+        self.definite = definite
+        self.maybe = maybe
+        self.dynamic = dynamic
+
+#########################################################################
+def resolve(node):
+    '''
+    resolve the variable references of a program.
+    '''
+    addresses.trim()
+    resolve_node(node, [])
+
+#########################################################################
+def address_of(node):
+    '''
+    the address (kind, depth) of a variable reference.
+    '''
+    return addresses.get(node) or ('scan', 0)
+
+#########################################################################
+def address(name, chain):
+    # chain is the list of frames of the enclosing function bodies,
+    # innermost first.
+    for (depth, frame) in enumerate(chain):
+        if frame.dynamic or name in frame.maybe and name not in frame.definite:
+            return ('scan', depth)
+        elif name in frame.definite:
+            return ('slot', depth)
+    return ('scan', len(chain))
+
+def enter_address(node, chain):
+    (kind, depth) = address(node[1], chain)
+    entry = addresses.get(node)
+    if entry and entry != (kind, depth):
+        (kind, depth) = ('scan', 0)
+    addresses.add(node, (kind, depth))
+
+#########################################################################
+# walk the statements and expressions of a program
+def resolve_node(node, chain):
+
+    if isinstance(node, list):
+        for n in node:
+            resolve_node(n, chain)
+        return
+    elif not isinstance(node, tuple) or not node or not isinstance(node[0], str):
+        return
+
+    type = node[0]
+
+    if type == 'id':
+        enter_address(node, chain)
+
+    elif type == 'function-exp':
+        resolve_function(node, chain)
+
+    elif type == 'unify':
+        (UNIFY, pattern, exp) = node
+        resolve_pattern(pattern)
+        resolve_node(exp, chain)
+
+    elif type == 'is':
+        (IS, term, pattern) = node
+        resolve_node(term, chain)
+        resolve_pattern(pattern)
+
+    elif type == 'for':
+        (FOR, (IN_EXP, (IN, pattern, list_term)), stmts) = node
+        resolve_pattern(pattern)
+        resolve_node(list_term, chain)
+        resolve_node(stmts, chain)
+
+    elif type == 'catch':
+        (CATCH, (CATCH_PATTERN, pattern), stmts) = node
+        resolve_pattern(pattern)
+        resolve_node(stmts, chain)
+
+    elif type == 'module-def':
+        # modules are executed in their own scope, the enclosing
+        # scopes are not statically known.
+        (MODULE_DEF, ID, stmts) = node
+        resolve_node(stmts, [])
+
+    elif type in ['pattern', 'deref', 'scope', 'typematch']:
+        resolve_pattern(node)
+
+    elif type in ['lineinfo', 'global', 'data']:
+        pass
+
+    else:
+        for child in node[1:]:
+            resolve_node(child, chain)
+
+#########################################################################
+# references in patterns are evaluated by the tree walker in the scopes
+# set up by pattern matching, they are not resolved.  function
+# expressions in patterns are executed in closures we know nothing about.
+def resolve_pattern(pattern):
+    if isinstance(pattern, list):
+        for p in pattern:
+            resolve_pattern(p)
+    elif isinstance(pattern, tuple) and pattern and isinstance(pattern[0], str):
+        if pattern[0] == 'function-exp':
+            resolve_function(pattern, [])
+        else:
+            for child in pattern[1:]:
+                resolve_pattern(child)
+
+#########################################################################
+def resolve_function(node, chain):
+
+    (FUNCTION_EXP, (BODY_LIST, (LIST, body_list_val))) = node
+
+    # collect the variables that may be bound in the function scope
+    maybe = {'this'}
+    dynamic = [False]
+    for i in range(0, len(body_list_val), 2):
+        (BODY, (PATTERN, p), stmts) = body_list_val[i+1]
+        pattern_variables(p, maybe, dynamic)
+        body_variables(stmts, maybe, dynamic)
+
+    for i in range(0, len(body_list_val), 2):
+        (BODY, (PATTERN, p), stmts) = body_list_val[i+1]
+        definite = set()
+        if not dynamic[0]:
+            definite_variables(p, definite)
+        frame = Frame(definite, maybe, dynamic[0])
+        resolve_pattern(p)
+        resolve_node(stmts, [frame] + chain)
+
+#########################################################################
+# the variables that are bound in the function scope whenever the
+# given clause pattern matches.
+def definite_variables(p, definite):
+    if p[0] == 'id':
+        if p[1] not in ['_', 'this']:
+            definite.add(p[1])
+    elif p[0] in ['list', 'tuple']:
+        for e in p[1]:
+            definite_variables(e, definite)
+    elif p[0] in ['head-tail', 'raw-head-tail']:
+        definite_variables(p[1], definite)
+        definite_variables(p[2], definite)
+
+#########################################################################
+# every variable that appears anywhere in a pattern may be bound by it
+def pattern_variables(p, maybe, dynamic):
+    if isinstance(p, list):
+        for e in p:
+            pattern_variables(e, maybe, dynamic)
+    elif isinstance(p, tuple) and p and isinstance(p[0], str):
+        if p[0] == 'id':
+            maybe.add(p[1])
+        elif p[0] == 'deref':
+            # first-class patterns can bind any variable
+            dynamic[0] = True
+        elif p[0] == 'function-exp':
+            pass
+        else:
+            for child in p[1:]:
+                pattern_variables(child, maybe, dynamic)
+
+#########################################################################
+# collect the variables bound by the statements of a function body not
+# including the bodies of nested functions.
+def body_variables(node, maybe, dynamic):
+    if isinstance(node, list):
+        for n in node:
+            body_variables(n, maybe, dynamic)
+        return
+    elif not isinstance(node, tuple) or not node or not isinstance(node[0], str):
+        return
+
+    type = node[0]
+
+    if type == 'function-exp' or type == 'lineinfo':
+        pass
+
+    elif type in ['global', 'load-stmt', 'module-def']:
+        dynamic[0] = True
+
+    elif type == 'apply' and node[1][0] == 'id' and node[1][1] in ['escape', 'eval']:
+        dynamic[0] = True
+
+    elif type == 'unify':
+        (UNIFY, pattern, exp) = node
+        pattern_variables(pattern, maybe, dynamic)
+        body_variables(exp, maybe, dynamic)
+
+    elif type == 'is':
+        (IS, term, pattern) = node
+        body_variables(term, maybe, dynamic)
+        pattern_variables(pattern, maybe, dynamic)
+
+    elif type == 'for':
+        (FOR, (IN_EXP, (IN, pattern, list_term)), stmts) = node
+        pattern_variables(pattern, maybe, dynamic)
+        body_variables(list_term, maybe, dynamic)
+        body_variables(stmts, maybe, dynamic)
+
+    elif type == 'catch':
+        (CATCH, (CATCH_PATTERN, pattern), stmts) = node
+        pattern_variables(pattern, maybe, dynamic)
+        body_variables(stmts, maybe, dynamic)
+
+    elif type == 'struct-def':
+        (STRUCT_DEF, (ID, struct_id), members) = node
+        maybe.add(struct_id)
+        body_variables(members, maybe, dynamic)
+
+    elif type in ['pattern', 'deref', 'scope', 'typematch']:
+        pattern_variables(node, maybe, dynamic)
+
+    else:
+        for child in node[1:]:
+            body_variables(child, maybe, dynamic)
@@ -25,6 +25,8 @@ class State:
         # this.
         self.error_trace = None
         self.debugger = None
+        # name of the engine that executes the AST, see 'engines' in walk.py
+        self.engine = 'walk'
 
 state = State()
 
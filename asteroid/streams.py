@@ -0,0 +1,233 @@
+#########################################################################
+# lazy streams
+#
+# a stream produces the values of a source one at a time.  the source
+# is a Python iterator over Asteroid values, e.g. an iterator over the
+# values of a list, over the integers of a range, over the lines of a
+# file, or a foreign generator.  the values are pulled from the source
+# only when the stream is read, at most one value ahead for 'peek' and
+# 'eof'.
+#
+# map, filter, take, drop and chunk change the stream in place by
+# wrapping its source into a generator.  the generators of consecutive
+# operations are fused, reading a value of the stream pulls exactly one
+# value through all of them.
+#
+# a stream over a list remembers the values it has read so that it can
+# be rewound, a stream over any other source forgets them and runs in
+# constant memory.
+#
+# (c) University of Rhode Island
+#########################################################################
+
+from itertools import islice
+from types import GeneratorType
+
+from asteroid.globals import integer_value
+from asteroid.natives import call_function, call_predicate, range_args
+
+#########################################################################
+# marks the end of a source
+end_of_source = object()
+
+#########################################################################
+def chunks(source, n):
+    '''
+    the lists of n consecutive values of the source, the last list holds
+    the remaining values and may be shorter.
+    '''
+    while True:
+        chunk = list(islice(source, n))
+        if not chunk:
+            return
+        yield ('list', chunk)
+
+#########################################################################
+class LazyStream:
+    '''
+    the stream state.  'values' holds the values pulled from the source
+    that are remembered, 'ix' is the position of the next value to read
+    in 'values'.  'source' is None once the source is exhausted.  values
+    appended to a stream whose source is not exhausted wait in 'tail'.
+    '''
+    __slots__ = ('values', 'ix', 'source', 'tail', 'rewindable')
+
+    def __init__(self, source, rewindable=False):
+        self.values = []
+        self.ix = 0
+        self.source = source
+        self.tail = []
+        self.rewindable = rewindable
+
+    ###################################################################
+    def fill(self):
+        '''
+        make the next value of the stream available at 'ix', return false
+        at the end of the stream.
+        '''
+        if self.ix < len(self.values):
+            return True
+        if not self.rewindable:
+            # all remembered values have been read
+            self.values.clear()
+            self.ix = 0
+        if self.source is not None:
+            value = next(self.source, end_of_source)
+            if value is not end_of_source:
+                self.values.append(value)
+                return True
+            self.source = None
+        if self.tail:
+            self.values.extend(self.tail)
+            self.tail = []
+            return True
+        return False
+
+    def eof(self):
+        return not self.fill()
+
+    def peek(self):
+        if self.fill():
+            return self.values[self.ix]
+        return ('none', None)
+
+    def get(self):
+        if self.fill():
+            value = self.values[self.ix]
+            self.ix += 1
+            return value
+        return ('none', None)
+
+    def rewind(self):
+        if not self.rewindable:
+            raise ValueError('rewind: only streams over lists and strings can be rewound')
+        self.ix = 0
+
+    def append(self, value):
+        if self.source is None:
+            self.values.append(value)
+        else:
+            self.tail.append(value)
+
+    ###################################################################
+    # the remaining values of the stream
+    def __iter__(self):
+        while self.fill():
+            value = self.values[self.ix]
+            self.ix += 1
+            yield value
+
+    def rest(self):
+        '''
+        an iterator over the values that have not been pulled from the
+        source yet including the values in 'tail'.  afterwards the source
+        and the tail are empty.
+        '''
+        rest = self.source
+        tail = self.tail
+        self.source = None
+        self.tail = []
+        if rest is None:
+            return iter(tail)
+        elif not tail:
+            return rest
+        else:
+            return (value for part in (rest, tail) for value in part)
+
+    def materialize(self):
+        '''
+        pull all the values of the source into 'values'.
+        '''
+        self.values.extend(self.rest())
+
+    ###################################################################
+    # the operations on the stream wrap the values that have not been
+    # read into a generator.  the remembered values that have been read
+    # are changed right away so that rewinding the stream produces the
+    # values as if the operation had been applied before reading.
+    def pending(self):
+        '''
+        the index of the first remembered value an operation applies to.
+        '''
+        return 0 if self.rewindable else self.ix
+
+    def map(self, f):
+        start = self.pending()
+        self.values[start:] = [call_function(f, value, 'f')
+                               for value in self.values[start:]]
+        self.source = (call_function(f, value, 'f') for value in self.rest())
+
+    def filter(self, p):
+        start = self.pending()
+        read = [value for value in self.values[start:self.ix]
+                if call_predicate(p, value, 'p')]
+        unread = [value for value in self.values[self.ix:]
+                  if call_predicate(p, value, 'p')]
+        self.values[start:] = read + unread
+        self.ix = start + len(read)
+        self.source = (value for value in self.rest()
+                       if call_predicate(p, value, 'p'))
+
+    def take(self, n):
+        # keep the next n values of the stream
+        unread = len(self.values) - self.ix
+        if n <= unread:
+            del self.values[self.ix+n:]
+            self.source = None
+            self.tail = []
+        else:
+            self.source = islice(self.rest(), n-unread)
+
+    def drop(self, n):
+        # skip the next n values of the stream
+        unread = len(self.values) - self.ix
+        if n <= unread:
+            self.ix += n
+        else:
+            self.ix = len(self.values)
+            self.source = islice(self.rest(), n-unread, None)
+
+    def chunk(self, n):
+        unread = self.values[self.ix:]
+        del self.values[self.ix:]
+        rest = self.rest()
+        self.source = chunks((value for part in (unread, rest) for value in part), n)
+
+#########################################################################
+def list_stream(values):
+    '''
+    the rewindable stream over a shallow copy of a list of values.
+    '''
+    return LazyStream(iter(values.copy()), rewindable=True)
+
+def range_stream(arg):
+    '''
+    the stream over the integers of the range denoted by the argument of
+    'range', None if the argument is not recognized.
+    '''
+    r = range_args(arg)
+    if r is None:
+        return None
+    return LazyStream(map(integer_value, r))
+
+def value_stream(val):
+    '''
+    the stream over the values of a list, the characters of a string, the
+    values of a foreign generator or the values produced by the '__iter__'
+    member of an object, e.g. the lines of a file.  a foreign stream is returned
+    as is.  None if val is none of these.
+    '''
+    from asteroid.walk import call_member
+    if val[0] == 'foreign' and val[1].__class__ is LazyStream:
+        return val[1]
+    elif val[0] == 'list':
+        return list_stream(val[1])
+    elif val[0] == 'string':
+        return LazyStream((('string', c) for c in val[1]), rewindable=True)
+    elif val[0] == 'foreign' and val[1].__class__ is GeneratorType:
+        return LazyStream(val[1])
+    elif val[0] == 'object':
+        iter_val = call_member(val, '__iter__', ('none', None))
+        if iter_val is not None:
+            return value_stream(iter_val)
+    return None
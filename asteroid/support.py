@@ -155,7 +155,7 @@ def map2boolean(value):
         return value
 
     elif value[0] in  ['integer', 'real', 'list', 'tuple', 'string']:
-        return ('boolean', bool(value[1]))
+        return ('boolean', True) if value[1] else ('boolean', False)
 
     elif value[0] in ['object', 'function-val', 'pattern']:
         return ('boolean', True)
@@ -188,6 +188,89 @@ def data_ix_list(memory):
 
     return ix_list
 
+###########################################################################################
+# structural hashing.  values of these types are hashable Python tuples and they are
+# their own keys.
+hashable_types = {'integer', 'real', 'string', 'boolean', 'none'}
+
+def structural_key(value):
+    '''
+    compute a hashable Python key for an Asteroid value such that structurally equal
+    values have equal keys.  lists, tuples, and the data members of objects are
+    compared element by element, all other values, e.g. functions or foreign objects,
+    are compared by identity.
+    '''
+    type = value[0]
+    if type in hashable_types:
+        return value
+    elif type in ['list', 'tuple']:
+        return (type, tuple([structural_key(v) for v in value[1]]))
+    elif type == 'object':
+        (OBJECT,
+         (STRUCT_ID, (ID, struct_id)),
+         (MEMBER_NAMES, (LIST, member_names)),
+         (OBJECT_MEMORY, (LIST, memory))) = value
+        return (type, struct_id, tuple([structural_key(v) for v in data_only(memory)]))
+    else:
+        return (type, id(value))
+
+def structural_table(values):
+    '''
+    compute a dictionary that maps the structural keys of the values to the values.
+    of structurally equal values the first one is kept.
+    '''
+    table = dict()
+    for value in values:
+        table.setdefault(structural_key(value), value)
+    return table
+
+###########################################################################################
+# the largest number of entries of a node cache
+max_cached_nodes = 2**12
+
+class NodeCache:
+    '''
+    a cache of the values computed for AST nodes, e.g. compiled code, keyed by node
+    identity.  an entry holds on to its node so that the id of the node cannot be reused
+    while the entry is in the cache.  the cache is bounded: 'put' empties a full cache
+    before it enters a new entry, this releases the nodes of code that is no longer run,
+    e.g. eval'd strings, and the values of the nodes that are still run are computed
+    again as they are needed.
+    NOTE: the cached values cannot be None.
+    '''
+    __slots__ = ('entries', 'maxsize')
+
+    def __init__(self, maxsize=max_cached_nodes):
+        self.entries = dict()
+        self.maxsize = maxsize
+
+    def get(self, node):
+        # the value cached for the node, None if there is none
+        entry = self.entries.get(id(node))
+        if entry:
+            return entry[1]
+        return None
+
+    def put(self, node, value):
+        if len(self.entries) >= self.maxsize:
+            self.entries.clear()
+        self.entries[id(node)] = (node, value)
+
+    def add(self, node, value):
+        # enter a value without emptying a full cache, see 'trim'
+        self.entries[id(node)] = (node, value)
+
+    def trim(self):
+        # empty the cache if it is full
+        if len(self.entries) >= self.maxsize:
+            self.entries.clear()
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
 ###########################################################################################
 def to_python_list(asteroid_list):
     '''
@@ -13,80 +13,111 @@ from pprint import pprint
 
 CURR_SCOPE = 0
 
+class Scope:
+    '''
+    a scope of the symbol table, a dictionary of symbols together with
+    the list of symbols declared global in this scope.  scopes are linked
+    to their parent scope and the links never change once a scope has been
+    created, therefore a chain of scopes can be shared by any number of
+    closures without copying it.
+    '''
+    __slots__ = ('symbols', 'globals', 'parent')
+
+    def __init__(self, symbols, parent):
+        self.symbols = symbols
+        self.globals = []
+        self.parent = parent
+
 class SymTab:
 
     def __init__(self):
         # global scope dictionary must always be present
-        self.scoped_symtab = [{}]
-        self.globals = [[]]
-        self.global_scope = self.scoped_symtab[0] # reference to global dictionary
+        self.scope = Scope({}, None)
+        self.global_scope = self.scope.symbols # reference to global dictionary
 
         # Stack of configs not currently in use
         self.saved_configs = []
 
+    def scopes(self):
+        # the scopes of the symbol table, innermost scope first
+        scope = self.scope
+        while scope:
+            yield scope
+            scope = scope.parent
+
     def dump(self):
         print("*** Symbol Table Dump:")
-        pprint(self.scoped_symtab)
+        pprint([scope.symbols for scope in self.scopes()])
         print("*** Globals Table:")
-        pprint(self.globals)
+        pprint([scope.globals for scope in self.scopes()])
         print("*** Global Scope:")
         pprint(self.global_scope)
 
     def get_closure(self):
-        # we make a shallow copy of the symbol table, globals...
-        return (list(self.scoped_symtab), list(self.globals), self.global_scope)
+        # scope chains are never modified, a closure simply shares the chain
+        return (self.scope, self.global_scope)
 
     def get_config(self):
         # return the relevant symtab objects
-        return (self.scoped_symtab, self.globals, self.global_scope)
+        return (self.scope, self.global_scope)
 
     def set_config(self, c):
-        self.scoped_symtab, self.globals, self.global_scope = c
+        self.scope, self.global_scope = c
 
     def push_scope(self, scope):
-        # push a new dictionary and globals lookup onto the stacks - stacks grow to the left
-        self.scoped_symtab.insert(CURR_SCOPE, scope)
-        self.globals.insert(CURR_SCOPE,[])
+        # link a new dictionary to the current scope
+        self.scope = Scope(scope, self.scope)
 
     def pop_scope(self):
-        # pop the left most dictionary off the stack
-        if len(self.scoped_symtab) == 1:
+        # unlink the current scope
+        if not self.scope.parent:
             raise ValueError("cannot pop the global scope")
         else:
-            scope = self.scoped_symtab.pop(CURR_SCOPE)
-            self.globals.pop(CURR_SCOPE)
+            scope = self.scope.symbols
+            self.scope = self.scope.parent
             return scope
 
+    def get_scope(self, depth):
+        # the scope at the given depth, raises IndexError if there is no such scope
+        scope = self.scope
+        for _ in range(depth):
+            scope = scope.parent
+            if not scope:
+                raise IndexError("scope depth out of range")
+        return scope
+
     def get_curr_scope(self, scope=CURR_SCOPE, option="items"):
+        symbols = self.get_scope(scope).symbols
         if option == "items":
-            return list(self.scoped_symtab[scope].items())
+            return list(symbols.items())
         elif option == "unifiers":
             unifiers = []
-            for (sym,val) in self.scoped_symtab[scope].items():
+            for (sym,val) in symbols.items():
                 unifiers += [(('id',sym),val)]
             return unifiers
         elif option == "keys":
-            return list(self.scoped_symtab[scope].keys())
+            return list(symbols.keys())
         elif option == "values":
-            return list(self.scoped_symtab[scope].values())
+            return list(symbols.values())
         else:
             raise ValueError("unknown option")
 
     def enter_sym(self, sym, value):
         # enter the symbol in the appropriate scope
-        if sym in self.globals[CURR_SCOPE]:
+        if sym in self.scope.globals:
             scope_dict = self.global_scope
         else:
-            scope_dict = self.scoped_symtab[CURR_SCOPE]
+            scope_dict = self.scope.symbols
 
         scope_dict[sym] = value
 
     def enter_global(self, sym):
         # enter the symbol in the global table at the appropriate scope
-        self.globals[CURR_SCOPE].append(sym)
+        self.scope.globals.append(sym)
 
-    def lookup_sym(self, sym, strict=True):
-        dict = self.find_sym_dict(sym)
+    def lookup_sym(self, sym, strict=True, depth=0):
+        # depth is the scope where the lookup starts, see resolver.py
+        dict = self.find_sym_dict(sym, depth)
         if not dict:
             if strict:
                 raise ValueError("'{}' is not defined".format(sym))
@@ -107,31 +138,39 @@ class SymTab:
             return
 
     def is_symbol_local(self, sym):
-        if sym in self.scoped_symtab[CURR_SCOPE]:
+        if sym in self.scope.symbols:
             return True
         else:
             return False
 
     def is_global(self, sym):
-        if sym in self.globals[CURR_SCOPE]:
+        if sym in self.scope.globals:
             return True
         else:
             return False
 
-    def find_sym_dict(self, sym):
-        n_scopes = len(self.scoped_symtab)
-        for scope in range(n_scopes):
-            if sym in self.scoped_symtab[scope]:
-                return self.scoped_symtab[scope]
+    def lookup_slot(self, sym, depth):
+        # look up a symbol resolved to the scope at the given depth,
+        # raises KeyError/IndexError if the symbol is not in that scope
+        return self.get_scope(depth).symbols[sym]
+
+    def find_sym_dict(self, sym, depth=0):
+        scope = self.scope
+        while scope and depth:
+            scope = scope.parent
+            depth -= 1
+        while scope:
+            if sym in scope.symbols:
+                return scope.symbols
+            scope = scope.parent
         # not found
         return None
 
     def dbg_find_sym(self, sym):
-        n_scopes = len(self.scoped_symtab)
-        for scope in range(n_scopes):
-            if sym in self.scoped_symtab[scope]:
+        for (depth, scope) in enumerate(self.scopes()):
+            if sym in scope.symbols:
                 return ("---- found symbol {} in scope {} with value {}"
-                      .format(sym, scope, self.scoped_symtab[scope].get(sym)))
+                      .format(sym, depth, scope.symbols.get(sym)))
         # not found
         return ("{} was not found".format(sym))
 
@@ -30,6 +30,11 @@ verbose_failure = False
 # control whether to do redundancy checks
 redundancy = True
 
+# the execution engine that runs the test cases, either the tree
+# walker 'walk', the closure compiler 'compile', or the bytecode
+# machine 'vm'
+engine = 'walk'
+
 # if your test case needs input from stdin please provide
 # a file named,
 #
@@ -80,7 +85,8 @@ for d in dirs:
             print("**********output***********")
             interp(p,
                    exceptions=verbose_failure,
-                   redundancy=redundancy)
+                   redundancy=redundancy,
+                   engine=engine)
             f.close()
     if old_val:
         os.environ['ASTEROIDPATH'] = old_val
@@ -0,0 +1,820 @@
+#########################################################################
+# A bytecode virtual machine for Asteroid programs
+#
+# the assembler translates the tuple AST of a statement list into a code
+# object: an integer array of (opcode, operand) pairs, a constant pool
+# that holds the names, patterns, and AST fragments the instructions refer
+# to, and a number of side tables.  the machine runs a code object in a
+# single dispatch loop over an operand stack.
+#
+# the semantics of the machine is exactly the semantics of the tree walker.
+# node types the assembler does not know about are handed off to the tree
+# walker.  function bodies stay AST in function values, they are assembled
+# when they are called for the first time.
+#
+# (c) University of Rhode Island
+#########################################################################
+
+import marshal
+from array import array
+
+from asteroid.globals import *
+from asteroid.support import *
+from asteroid.state import state, warning
+from asteroid.walk import walk, engines, match_pattern, try_match, declare_unifiers, \
+     completed, read_at_ix, to_list, \
+     is_range_exp, to_range, apply_range, loop_terms, in_list, \
+     function_name, apply_function, handle_call, tail_call, \
+     exception_value, select_catch, binary_operator_functions, \
+     unary_operator_functions, nullary_operator_functions
+from asteroid.resolver import address_of
+
+#########################################################################
+# opcodes, every instruction is an opcode followed by one operand.
+# the most frequently executed instructions come first, the machine
+# tests the opcodes in this order.
+(
+    STMT,               # set lineinfo to lines[arg], clear the completion
+    LOAD_NAME,          # push the value of the variable consts[arg]
+    CONST,              # push consts[arg]
+    BINARY,             # pop b, a push binary_functions[arg](a,b)
+    CALL,               # pop arg, f push result, consts[arg] = (f ast, f name)
+    STORE_NAME,         # pop a value and bind it to the variable consts[arg]
+    LOAD_SLOT,          # push the variable consts[arg] = (depth, name) bound in scope depth
+    LOAD_FROM,          # push the variable consts[arg] = (depth, name) scanning from scope depth
+    POP_JUMP_IF_FALSE,  # pop a boolean and jump to arg if it is false
+    JUMP,               # jump to arg
+    POP_TOP,            # pop the top of the stack
+    STEP,               # single step the debugger
+    UNIFY,              # pop a term and unify it with pattern consts[arg]
+    INDEX,              # pop a structure push its element at index consts[arg]
+    BUILD_LIST,         # pop arg values push a list value
+    BUILD_TUPLE,        # pop arg values push a tuple value
+    RETURN,             # pop a value and return it from the function
+    TAIL_CALL,          # pop arg, f and return the call from the function, consts[arg] = (f ast, f name)
+    SET_RET,            # pop a value and make it the completion
+    LINE,               # set lineinfo to lines[arg]
+    IS,                 # pop a term push whether it matches pattern consts[arg]
+    IN,                 # pop a list or range and a value push whether the value is in it
+    OR,                 # short circuit 'or', jump to arg if the top is true
+    OR_END,             # pop b, a push a or b
+    AND,                # short circuit 'and', jump to arg if the top is false
+    AND_END,            # pop b, a push a and b
+    UNARY,              # pop a push unary_functions[arg](a)
+    NULLARY,            # pop a push nullary_functions[arg](a)
+    FUNCTION,           # push a closure for the body list consts[arg]
+    TO_LIST,            # pop step, stop, start push the list value
+    TO_RANGE,           # pop step, stop, start push the Python range of the list
+    CALL_RANGE,         # pop arg, f push the result of 'range', a Python range, consts[arg] = f ast
+    HEAD_TAIL,          # pop tail, head push the list value
+    GET_ITER,           # pop a list, string, tuple, or range push an iterator over it
+    FOR_ITER,           # push the next term of the iterator or jump to arg
+    FOR_UNIFY,          # pop a term, if it does not match consts[arg] continue the loop
+    SETUP_LOOP,         # push a loop block, break jumps to arg
+    SETUP_TRY,          # push a try block with handler handlers[arg]
+    POP_BLOCK,          # pop a loop or try block
+    BREAK,              # break out of the innermost loop
+    THROW,              # pop a value and throw it
+    MODULE,             # execute the module definition consts[arg]
+    EXEC,               # execute statement consts[arg] with the tree walker, it sets the completion
+    EVAL,               # push the value of expression consts[arg] computed by the tree walker
+    HALT,               # stop the machine and return the completion
+) = range(45)
+
+# binary, unary, and nullary operators are identified by their index in
+# these tuples.
+binary_operator_names = tuple(sorted(binary_operator_functions))
+unary_operator_names = tuple(sorted(unary_operator_functions))
+nullary_operator_names = tuple(sorted(nullary_operator_functions))
+
+binary_functions = [binary_operator_functions[op] for op in binary_operator_names]
+unary_functions = [unary_operator_functions[op] for op in unary_operator_names]
+nullary_functions = [nullary_operator_functions[op] for op in nullary_operator_names]
+
+# block types
+LOOP_BLOCK = 0
+TRY_BLOCK = 1
+
+# the statements that single step the debugger in the tree walker
+step_stmts = {
+    'exp-stmt', 'unify', 'return', 'tail-call', 'break', 'throw', 'try', 'loop',
+    'while', 'repeat', 'for', 'match', 'if', 'load-stmt',
+}
+
+#########################################################################
+class Code:
+    '''
+    a compiled statement list.
+
+      * ops: integer array of (opcode, operand) pairs
+      * consts: the constant pool
+      * lines: the lineinfo table, STMT and LINE instructions index this table
+      * conditions: maps the position of a conditional jump to the name of
+                    the construct it belongs to, used in error messages
+      * handlers: the catch clauses and their entry points for each try statement
+    '''
+    def __init__(self, ops, consts, lines, conditions, handlers):
+        self.ops = array('i', ops)
+        self.consts = consts
+        self.lines = lines
+        self.conditions = conditions
+        self.handlers = handlers
+        # the machine dispatches on a list, indexing a list is faster
+        # than indexing an array.
+        self.instructions = self.ops.tolist()
+
+#########################################################################
+# serialized code objects start with a version tag. the opcode numbering
+# and the operator tables above are part of the format.
+CODE_VERSION = ('asteroid-vm', 5, binary_operator_names, unary_operator_names, nullary_operator_names)
+
+def dumps(code):
+    '''
+    serialize a code object into a byte string.
+    '''
+    return marshal.dumps((CODE_VERSION,
+                          code.ops.tobytes(),
+                          code.consts,
+                          code.lines,
+                          code.conditions,
+                          code.handlers))
+
+def loads(data):
+    '''
+    recreate a code object from a byte string written by 'dumps'.
+    '''
+    (version, ops, consts, lines, conditions, handlers) = marshal.loads(data)
+    if version != CODE_VERSION:
+        raise ValueError("incompatible bytecode version")
+    ops_array = array('i')
+    ops_array.frombytes(ops)
+    return Code(ops_array, consts, lines, conditions, handlers)
+
+#########################################################################
+# the assembler
+#########################################################################
+class Assembler:
+
+    def __init__(self):
+        self.ops = []
+        self.consts = []
+        self.const_ix = dict()
+        self.lines = []
+        self.line_ix = dict()
+        self.conditions = dict()
+        self.handlers = []
+
+    def code(self):
+        self.emit(HALT)
+        return Code(self.ops,
+                    self.consts,
+                    self.lines,
+                    self.conditions,
+                    self.handlers)
+
+    def emit(self, op, arg=0):
+        self.ops += [op, arg]
+        return len(self.ops) - 2
+
+    def label(self):
+        return len(self.ops)
+
+    def patch(self, pos, target):
+        self.ops[pos+1] = target
+
+    def const(self, value):
+        # constants are shared by identity, AST nodes are compared by
+        # identity and not by value.
+        key = id(value)
+        if key not in self.const_ix:
+            self.const_ix[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_ix[key]
+
+    def line(self, lineinfo):
+        if lineinfo not in self.line_ix:
+            self.line_ix[lineinfo] = len(self.lines)
+            self.lines.append(lineinfo)
+        return self.line_ix[lineinfo]
+
+    def jump_if_false(self, construct):
+        pos = self.emit(POP_JUMP_IF_FALSE)
+        self.conditions[pos] = construct
+        return pos
+
+    ###################################################################
+    # statements
+    def stmt_list(self, node):
+        (STMT_LIST, (LIST, stmts)) = node
+        assert_match(STMT_LIST, 'stmt-list')
+        assert_match(LIST, 'list')
+
+        # the parser prefixes every statement with its lineinfo, statement
+        # lists of any other shape are left to the tree walker.
+        if len(stmts) % 2 \
+           or any(stmts[i][0] != 'lineinfo' or stmts[i+1][0] == 'lineinfo'
+                  for i in range(0, len(stmts), 2)):
+            self.emit(EXEC, self.const(node))
+            return
+
+        for i in range(0, len(stmts), 2):
+            self.emit(STMT, self.line(stmts[i][1]))
+            self.stmt(stmts[i+1])
+
+    def stmt(self, node):
+        type = node[0]
+
+        if type in step_stmts:
+            self.emit(STEP)
+
+        if type == 'stmt-list':
+            self.stmt_list(node)
+
+        elif type == 'lineinfo':
+            self.emit(LINE, self.line(node[1]))
+
+        elif type == 'noop':
+            pass
+
+        elif type == 'exp-stmt':
+            (EXP_STMT, exp) = node
+            self.exp(exp)
+            self.emit(SET_RET)
+
+        elif type == 'unify':
+            (UNIFY_, pattern, exp) = node
+            self.exp(exp)
+            if pattern[0] == 'id' and pattern[1] not in ['_', 'this']:
+                self.emit(STORE_NAME, self.const(pattern))
+            else:
+                self.emit(UNIFY, self.const(pattern))
+
+        elif type == 'return':
+            self.exp(node[1])
+            self.emit(RETURN)
+
+        elif type == 'tail-call':
+            (APPLY, f, arg) = node[1]
+            try:
+                f_name = function_name(f)
+            except Exception:
+                self.emit(EXEC, self.const(node))
+                return
+            self.exp(f)
+            self.exp(arg)
+            self.emit(TAIL_CALL, self.const((f, f_name)))
+
+        elif type == 'break':
+            self.emit(BREAK)
+
+        elif type == 'throw':
+            self.exp(node[1])
+            self.emit(THROW)
+
+        elif type == 'try':
+            (TRY,
+             try_stmts,
+             (CATCH_LIST, (LIST, catch_list))) = node
+            handler = len(self.handlers)
+            targets = []
+            self.handlers.append((catch_list, targets))
+            self.emit(SETUP_TRY, handler)
+            self.stmt(try_stmts)
+            self.emit(POP_BLOCK)
+            exits = [self.emit(JUMP)]
+            for (CATCH, CATCH_PATTERN, catch_stmts) in catch_list:
+                targets.append(self.label())
+                self.stmt(catch_stmts)
+                exits.append(self.emit(JUMP))
+            for pos in exits:
+                self.patch(pos, self.label())
+
+        elif type == 'loop':
+            (LOOP, body_stmts) = node
+            setup = self.emit(SETUP_LOOP)
+            top = self.label()
+            self.stmt(body_stmts)
+            self.emit(JUMP, top)
+            self.patch(setup, self.label())
+
+        elif type == 'while':
+            (WHILE, (COND_EXP, cond), body_stmts) = node
+            setup = self.emit(SETUP_LOOP)
+            top = self.label()
+            self.exp(cond)
+            exit = self.jump_if_false('while loop')
+            self.stmt(body_stmts)
+            self.emit(JUMP, top)
+            self.patch(exit, self.label())
+            self.emit(POP_BLOCK)
+            self.patch(setup, self.label())
+
+        elif type == 'repeat':
+            (REPEAT, body_stmts, (COND_EXP, cond)) = node
+            setup = self.emit(SETUP_LOOP)
+            top = self.label()
+            self.stmt(body_stmts)
+            self.exp(cond)
+            # jump back to the top while the condition is false
+            self.patch(self.jump_if_false('repeat loop'), top)
+            self.emit(POP_BLOCK)
+            self.patch(setup, self.label())
+
+        elif type == 'for':
+            (FOR, (IN_EXP, (IN_, pattern, list_term)), stmt_list) = node
+            self.range_or_exp(list_term)
+            self.emit(GET_ITER)
+            # the iterator stays on the stack for the duration of the loop
+            setup = self.emit(SETUP_LOOP)
+            top = self.emit(FOR_ITER)
+            self.emit(FOR_UNIFY, self.const(pattern))
+            self.stmt(stmt_list)
+            self.emit(JUMP, top)
+            self.patch(top, self.label())
+            self.emit(POP_BLOCK)
+            self.patch(setup, self.label())
+            self.emit(POP_TOP)
+
+        elif type == 'match':
+            (MATCH, val, if_clauses) = node
+            self.stmt(val)
+            self.stmt(if_clauses)
+
+        elif type == 'if':
+            (IF, (LIST, if_list)) = node
+            exits = []
+            for i in range(0,len(if_list),2):
+                (LINEINFO, lineinfo) = if_list[i]
+                (IF_CLAUSE,
+                 (COND, cond),
+                 stmts) = if_list[i+1]
+                self.emit(LINE, self.line(lineinfo))
+                self.exp(cond)
+                next = self.jump_if_false('if clause')
+                self.stmt(stmts)
+                exits.append(self.emit(JUMP))
+                self.patch(next, self.label())
+            for pos in exits:
+                self.patch(pos, self.label())
+
+        elif type == 'load-stmt':
+            (LOAD_STMT, inlist) = node
+            self.stmt(inlist)
+
+        elif type == 'module-def':
+            self.emit(MODULE, self.const(node))
+
+        else:
+            # let the tree walker deal with it, this includes the
+            # error message for unknown node types
+            self.emit(EXEC, self.const(node))
+
+    ###################################################################
+    # expressions
+    def exp(self, node):
+        type = node[0]
+
+        if type in ['none','nil','string','integer','real','boolean',
+                    'object','pattern','foreign','member-function-val']:
+            self.emit(CONST, self.const(node))
+
+        elif type == 'id':
+            (kind, depth) = address_of(node)
+            if kind == 'slot':
+                self.emit(LOAD_SLOT, self.const((depth, node[1])))
+            elif depth > 0:
+                self.emit(LOAD_FROM, self.const((depth, node[1])))
+            else:
+                self.emit(LOAD_NAME, self.const(node[1]))
+
+        elif type == 'apply':
+            self.apply(node)
+
+        elif type == 'index' and is_range_exp(node[1]):
+            # indexing a range does not need the list
+            self.emit(EVAL, self.const(node))
+
+        elif type == 'index':
+            (INDEX_, structure, ix) = node
+            self.exp(structure)
+            self.emit(INDEX, self.const(ix))
+
+        elif type in ['list', 'tuple']:
+            for e in node[1]:
+                self.exp(e)
+            self.emit(BUILD_LIST if type == 'list' else BUILD_TUPLE, len(node[1]))
+
+        elif type == 'is':
+            (IS_, term, pattern) = node
+            self.exp(term)
+            self.emit(IS, self.const(pattern))
+
+        elif type == 'in':
+            (IN_, exp, exp_list) = node
+            self.exp(exp)
+            self.range_or_exp(exp_list)
+            self.emit(IN)
+
+        elif type == 'if-exp' and node[3][0] != 'null':
+            (IF_EXP, cond_exp, then_exp, else_exp) = node
+            self.exp(cond_exp)
+            other = self.jump_if_false('if expression')
+            self.exp(then_exp)
+            exit = self.emit(JUMP)
+            self.patch(other, self.label())
+            self.exp(else_exp)
+            self.patch(exit, self.label())
+
+        elif type in ['to-list', 'raw-to-list']:
+            (TOLIST, (START, start), (STOP, stop), (STEP_, step)) = node
+            self.exp(start)
+            self.exp(stop)
+            self.exp(step)
+            self.emit(TO_LIST)
+
+        elif type in ['head-tail', 'raw-head-tail']:
+            (HEAD_TAIL_, head, tail) = node
+            self.exp(head)
+            self.exp(tail)
+            self.emit(HEAD_TAIL)
+
+        elif type == 'function-exp':
+            self.emit(FUNCTION, self.const(node[1]))
+
+        else:
+            # let the tree walker deal with it, this includes the error
+            # messages for illegal expressions and unknown node types
+            self.emit(EVAL, self.const(node))
+
+    def apply(self, node):
+        (APPLY, f, arg) = node
+
+        if f[0] == 'id' and f[1] in builtins:
+            opname = f[1]
+            if opname in ['__or__', '__and__'] \
+               and arg[0] == 'tuple' and len(arg[1]) == 2:
+                (TUPLE, [a,b]) = arg
+                self.exp(a)
+                skip = self.emit(OR if opname == '__or__' else AND)
+                self.exp(b)
+                self.emit(OR_END if opname == '__or__' else AND_END)
+                self.patch(skip, self.label())
+            elif opname in binary_operator_names \
+                 and arg[0] == 'tuple' and len(arg[1]) == 2:
+                (TUPLE, [a,b]) = arg
+                self.exp(a)
+                self.exp(b)
+                self.emit(BINARY, binary_operator_names.index(opname))
+            elif opname in unary_operator_names:
+                self.exp(arg)
+                self.emit(UNARY, unary_operator_names.index(opname))
+            elif opname in nullary_operator_names:
+                self.exp(arg)
+                self.emit(NULLARY, nullary_operator_names.index(opname))
+            else:
+                self.emit(EVAL, self.const(node))
+            return
+
+        # the length of a range does not need the list
+        if f[0] == 'index' and f[2] == ('id', 'length') and is_range_exp(f[1]):
+            self.emit(EVAL, self.const(node))
+            return
+
+        # malformed function expressions are reported when they are
+        # executed, leave them to the tree walker.
+        try:
+            f_name = function_name(f)
+        except Exception:
+            self.emit(EVAL, self.const(node))
+            return
+
+        self.exp(f)
+        self.exp(arg)
+        self.emit(CALL, self.const((f, f_name)))
+
+    def range_or_exp(self, node):
+        # range expressions that are the operands of the for statement
+        # and the 'in' operator evaluate to Python ranges, see
+        # 'is_range_exp' in the tree walker.
+        if node[0] == 'apply' and is_range_exp(node):
+            (APPLY, f, arg) = node
+            self.exp(f)
+            self.exp(arg)
+            self.emit(CALL_RANGE, self.const(f))
+        elif is_range_exp(node):
+            (TOLIST, (START, start), (STOP, stop), (STEP, step)) = node
+            self.exp(start)
+            self.exp(stop)
+            self.exp(step)
+            self.emit(TO_RANGE)
+        else:
+            self.exp(node)
+
+def assemble(node):
+    '''
+    translate a statement AST into a code object.
+    '''
+    assembler = Assembler()
+    assembler.stmt(node)
+    return assembler.code()
+
+#########################################################################
+# the machine
+#########################################################################
+def run(code):
+    '''
+    execute a code object and return its completion, the completion is
+    the value of the last expression statement unless a statement after
+    it cleared it.
+    '''
+    instructions = code.instructions
+    consts = code.consts
+    lines = code.lines
+    stack = []
+    blocks = []
+    completion = None
+    pc = 0
+
+    while True:
+        try:
+            while True:
+                op = instructions[pc]
+                arg = instructions[pc+1]
+                pc += 2
+
+                if op == STMT:
+                    state.lineinfo = lines[arg]
+                    completion = None
+
+                elif op == LOAD_NAME:
+                    stack.append(state.symbol_table.lookup_sym(consts[arg]))
+
+                elif op == CONST:
+                    stack.append(consts[arg])
+
+                elif op == BINARY:
+                    b = stack.pop()
+                    stack[-1] = binary_functions[arg](stack[-1], b)
+
+                elif op == CALL:
+                    arg_val = stack.pop()
+                    f_val = stack.pop()
+                    (f, f_name) = consts[arg]
+                    if f_val[0] == 'function-val' and f_val[1][0] != 'native':
+                        stack.append(handle_call(None, f_val, arg_val, f_name))
+                    else:
+                        stack.append(apply_function(f, f_name, f_val, arg_val))
+
+                elif op == STORE_NAME:
+                    term = stack.pop()
+                    pattern = consts[arg]
+                    if term[0] in unify_not_allowed_terms:
+                        declare_unifiers(match_pattern(term, pattern))
+                    else:
+                        name = pattern[1]
+                        symbol_table = state.symbol_table
+                        id_val = symbol_table.lookup_sym(name, strict=False)
+                        if id_val and id_val[0] == 'pattern':
+                            warning("you are overwriting a pattern stored in '{}'"
+                                    .format(name))
+                        symbol_table.enter_sym(name, term)
+
+                elif op == LOAD_SLOT:
+                    (depth, name) = consts[arg]
+                    try:
+                        stack.append(state.symbol_table.lookup_slot(name, depth))
+                    except (KeyError, IndexError):
+                        stack.append(state.symbol_table.lookup_sym(name))
+
+                elif op == LOAD_FROM:
+                    (depth, name) = consts[arg]
+                    stack.append(state.symbol_table.lookup_sym(name, depth=depth))
+
+                elif op == POP_JUMP_IF_FALSE:
+                    (cond_type, cond_val) = stack.pop()
+                    if cond_type != 'boolean':
+                        raise ValueError("found '{}' expected 'boolean' in {}"
+                                         .format(cond_type, code.conditions[pc-2]))
+                    if not cond_val:
+                        pc = arg
+
+                elif op == JUMP:
+                    pc = arg
+
+                elif op == POP_TOP:
+                    stack.pop()
+
+                elif op == STEP:
+                    if state.debugger: state.debugger.step()
+
+                elif op == UNIFY:
+                    declare_unifiers(match_pattern(stack.pop(), consts[arg]))
+
+                elif op == INDEX:
+                    stack[-1] = read_at_ix(stack[-1], consts[arg])
+
+                elif op == BUILD_LIST or op == BUILD_TUPLE:
+                    if arg:
+                        values = stack[-arg:]
+                        del stack[-arg:]
+                    else:
+                        values = []
+                    stack.append(('list' if op == BUILD_LIST else 'tuple', values))
+
+                elif op == RETURN:
+                    return ReturnValue(stack.pop())
+
+                elif op == TAIL_CALL:
+                    arg_val = stack.pop()
+                    f_val = stack.pop()
+                    (f, f_name) = consts[arg]
+                    return tail_call(f, f_name, f_val, arg_val)
+
+                elif op == SET_RET:
+                    completion = stack.pop()
+
+                elif op == LINE:
+                    state.lineinfo = lines[arg]
+
+                elif op == IS:
+                    unifiers = try_match(stack[-1], consts[arg])
+                    if unifiers is None:
+                        stack[-1] = ('boolean', False)
+                    else:
+                        declare_unifiers(unifiers)
+                        stack[-1] = ('boolean', True)
+
+                elif op == IN:
+                    exp_list_val = stack.pop()
+                    stack[-1] = in_list(stack[-1], exp_list_val)
+
+                elif op == OR or op == AND:
+                    val_a = stack[-1]
+                    if val_a[0] != 'boolean':
+                        raise ValueError(
+                            "found '{} expected 'boolean and boolean'"
+                            .format(val_a[0]))
+                    if val_a[1] == (op == OR):
+                        stack[-1] = boolean_value(val_a[1])
+                        pc = arg
+
+                elif op == OR_END or op == AND_END:
+                    val_b = stack.pop()
+                    val_a = stack[-1]
+                    if val_b[0] != 'boolean':
+                        raise ValueError(
+                            "found '{} and {}' expected 'boolean and boolean'"
+                            .format(val_a[0],val_b[0]))
+                    if op == OR_END:
+                        stack[-1] = true_value if val_a[1] or val_b[1] else false_value
+                    else:
+                        stack[-1] = true_value if val_a[1] and val_b[1] else false_value
+
+                elif op == UNARY:
+                    stack[-1] = unary_functions[arg](stack[-1])
+
+                elif op == NULLARY:
+                    stack[-1] = nullary_functions[arg](stack[-1])
+
+                elif op == FUNCTION:
+                    stack.append(('function-val',
+                                  consts[arg],
+                                  state.symbol_table.get_closure()))
+
+                elif op == TO_LIST:
+                    step = stack.pop()
+                    stop = stack.pop()
+                    stack[-1] = to_list(stack[-1], stop, step)
+
+                elif op == TO_RANGE:
+                    step = stack.pop()
+                    stop = stack.pop()
+                    stack[-1] = to_range(stack[-1], stop, step)
+
+                elif op == CALL_RANGE:
+                    arg_val = stack.pop()
+                    stack[-1] = apply_range(consts[arg], stack[-1], arg_val)
+
+                elif op == HEAD_TAIL:
+                    (TAIL_TYPE, tail_val) = stack.pop()
+                    if TAIL_TYPE != 'list':
+                        raise ValueError(
+                            "unsupported tail type '{}' in head-tail operator".
+                            format(TAIL_TYPE))
+                    stack[-1] = ('list', [stack[-1]] + tail_val)
+
+                elif op == GET_ITER:
+                    stack[-1] = iter(loop_terms(stack[-1]))
+
+                elif op == FOR_ITER:
+                    term = next(stack[-1], None)
+                    if term is None:
+                        pc = arg
+                    else:
+                        stack.append(term)
+
+                elif op == FOR_UNIFY:
+                    unifiers = try_match(stack.pop(), consts[arg])
+                    if unifiers is None:
+                        # back to the FOR_ITER instruction
+                        pc -= 4
+                    else:
+                        declare_unifiers(unifiers)
+
+                elif op == SETUP_LOOP:
+                    blocks.append((LOOP_BLOCK, arg, len(stack)))
+
+                elif op == SETUP_TRY:
+                    blocks.append((TRY_BLOCK, arg, len(stack)))
+
+                elif op == POP_BLOCK:
+                    blocks.pop()
+
+                elif op == BREAK:
+                    raise Break()
+
+                elif op == THROW:
+                    raise ThrowValue(stack.pop())
+
+                elif op == MODULE:
+                    module_def(consts[arg])
+
+                elif op == EXEC:
+                    completion = walk(consts[arg])
+                    if isinstance(completion, ReturnValue):
+                        return completion
+
+                elif op == EVAL:
+                    stack.append(walk(consts[arg]))
+
+                elif op == HALT:
+                    return completion
+
+                else:
+                    raise ValueError("unknown opcode {}".format(op))
+
+        except Exception as e:
+            inst = e
+
+        # we had an exception - unwind the blocks of this code object
+        # looking for a loop that handles a break or a try statement
+        # that handles the exception.
+        while True:
+            if not blocks:
+                raise inst
+            (block_type, target, height) = blocks.pop()
+            del stack[height:]
+
+            if block_type == LOOP_BLOCK:
+                if isinstance(inst, Break):
+                    pc = target
+                    break
+
+            elif block_type == TRY_BLOCK:
+                # return values raised by eval'ed code should never be
+                # captured by user level try stmts
+                if isinstance(inst, ReturnValue):
+                    continue
+                (catch_list, targets) = code.handlers[target]
+                try:
+                    i = select_catch(exception_value(inst), catch_list)
+                except Exception as e:
+                    inst = e
+                    continue
+                if i is not None:
+                    pc = targets[i]
+                    break
+
+#########################################################################
+def module_def(node):
+
+    (MODULE_DEF, (ID, modname), stmts) = node
+    assert_match(MODULE_DEF, 'module-def')
+
+    state.symbol_table.push_scope({})
+    if state.debugger: state.debugger.enter_module(modname)
+    completed(execute(stmts))
+    closure = state.symbol_table.get_closure()
+    if state.debugger: state.debugger.exit_module(modname)
+    state.symbol_table.pop_scope()
+
+    module_type = ('module', ('id', modname), ('scope', closure))
+    state.symbol_table.enter_sym(modname, module_type)
+
+#########################################################################
+# code objects are cached by node identity in a bounded cache, see
+# 'NodeCache' in support.py.
+code_cache = NodeCache()
+
+def execute(node):
+    '''
+    assemble the given statement AST and run it on the machine, this is
+    the entry point of the virtual machine as an execution engine.
+    '''
+    code = code_cache.get(node)
+    if not code:
+        code = assemble(node)
+        code_cache.put(node, code)
+    return run(code)
+
+engines['vm'] = execute
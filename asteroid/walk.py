@@ -4,13 +4,17 @@
 # (c) University of Rhode Island
 #########################################################################
 
+import ast as python_ast
 from copy import deepcopy,copy
-from re import match as re_match
+from re import compile as re_compile
+from functools import lru_cache
 from math import isclose
+from types import GeneratorType
 
 from asteroid.globals import *
 from asteroid.support import *
 from asteroid.state import state, warning
+from asteroid.natives import native_functions, native_members, integer_range, integer_list, range_args
 
 #########################################################################
 # this dictionary maps list member function names to function
@@ -28,12 +32,92 @@ string_member_functions = dict()
 __retval__ = None  # return value register for escaped code
 
 #########################################################################
-# return values for function computed by the last expression executed
-# in the context of a function.  note that we consider global code
-# to be part of the 'top-level' function
-function_return_value = [None]
+# escaped code is compiled only once.  the cache maps the source string of
+# an escape to a pair (code, hoisted) where 'code' is the compiled code object
+# and 'hoisted' is the dictionary of names bound by the top-level import
+# statements of the escape.  those imports are executed once at compile time
+# and the resulting bindings are handed to every execution of the code.
+# the source of an escape can be computed at run time, the cache is
+# bounded and emptied when it is full, like 'NodeCache' in support.py.
+max_cached_escapes = 2**10
+escape_cache = dict()
+escape_cache_hits = 0
+escape_cache_misses = 0
+
+def compile_escape(source):
+    global escape_cache_hits, escape_cache_misses
+
+    entry = escape_cache.get(source)
+    if entry:
+        escape_cache_hits += 1
+        return entry
+
+    escape_cache_misses += 1
+    module = python_ast.parse(source, filename='<escape>')
+    imports = []
+    body = []
+    for s in module.body:
+        if isinstance(s, (python_ast.Import, python_ast.ImportFrom)):
+            imports.append(s)
+        else:
+            body.append(s)
+
+    hoisted = dict()
+    if imports:
+        import_module = python_ast.Module(body=imports, type_ignores=[])
+        exec(compile(import_module, '<escape>', 'exec'), globals(), hoisted)
+    body_module = python_ast.Module(body=body, type_ignores=[])
+    code = compile(body_module, '<escape>', 'exec')
+
+    entry = (code, hoisted)
+    if len(escape_cache) >= max_cached_escapes:
+        escape_cache.clear()
+    escape_cache[source] = entry
+    return entry
+
+def escape_cache_info():
+    '''
+    return a tuple (hits, misses, size, hit rate) describing the
+    escape compile cache.
+    '''
+    lookups = escape_cache_hits + escape_cache_misses
+    rate = escape_cache_hits / lookups if lookups else 0.0
+    return (escape_cache_hits, escape_cache_misses, len(escape_cache), rate)
+
+#########################################################################
+# statements return a completion to the statement list they appear in:
+#
+#   None:           the statement completed without a value
+#   value:          the value of an expression statement, the last value
+#                   of a function body is the return value of the function
+#   ReturnValue:    a return statement completed the function body, the
+#                   completion is passed up to 'handle_call' without
+#                   executing any further statements
+#
+# the value of the last statement executed by the most recent program,
+# the repl prints it.
+program_value = [None]
 
 ###########################################################################################
+# string patterns are regular expressions that have to match the whole
+# term.  a string pattern is compiled only once into a predicate on
+# strings: the strings of literal patterns when the pattern is compiled,
+# see 'compile_literal', all others through a bounded LRU cache.
+# patterns without regular expression metacharacters are matched by
+# comparing strings.
+regex_metacharacters = set('.^$*+?{}[]\\|()')
+
+def compile_string_pattern(pattern):
+    if regex_metacharacters.isdisjoint(pattern):
+        # NOTE: '$' also matches in front of a trailing newline
+        pattern_newline = pattern + '\n'
+        return lambda term : term == pattern or term == pattern_newline
+    else:
+        return re_compile("^"+pattern+"$").match
+
+string_pattern_predicate = lru_cache(maxsize=1024)(compile_string_pattern)
+
+#########################################################################
 def unify(term, pattern, unifying = True ):
     '''
     unify term and pattern recursively and return the unifier.
@@ -64,20 +148,20 @@ def unify(term, pattern, unifying = True ):
     if isinstance(term, str): 
         # apply regular expression match
         # Note: a pattern needs to match the whole term.
-        if isinstance(pattern, str) and re_match("^"+pattern+"$", term):
+        if isinstance(pattern, str) and string_pattern_predicate(pattern)(term):
             return [] # return empty unifier
         else:
             raise PatternMatchFailed(
-                "regular expression '{}' did not match '{}'"
-                .format(pattern, term))
+                "regular expression '{}' did not match '{}'",
+                pattern, term)
                 
     elif isinstance(term, (int, float, bool)):
         if term == pattern:
             return [] # return an empty unifier
         else:
             raise PatternMatchFailed(
-                "'{}' is not the same as '{}'"
-                .format(term, pattern))
+                "'{}' is not the same as '{}'",
+                term, pattern)
 
     elif isinstance(term, list) or isinstance(pattern, list):
         if not(isinstance(term, list)) or not(isinstance(pattern, list)):
@@ -143,22 +227,22 @@ def unify(term, pattern, unifying = True ):
         # make sure apply id's match
         if t_id != p_id:
             raise PatternMatchFailed(
-                "term '{}' does not match pattern '{}'"
-                .format(t_id, p_id))
+                "term '{}' does not match pattern '{}'",
+                t_id, p_id)
         # unify the args
         return unify(t_arg, p_arg, unifying)
 
-    elif term[0] in (unify_not_allowed - {'function-val', 'foreign'}):
+    elif term[0] in unify_not_allowed_terms:
         # NOTE: functions/foreign are allowed in terms as long as they are matched
         # by a variable in the pattern - anything else will fail
         raise PatternMatchFailed(
-            "term of type '{}' not allowed in pattern matching"
-            .format(term[0]))
+            "term of type '{}' not allowed in pattern matching",
+            term[0])
 
     elif pattern[0] in unify_not_allowed:
         raise PatternMatchFailed(
-            "pattern of type '{}' not allowed in pattern matching"
-            .format(pattern[0]))
+            "pattern of type '{}' not allowed in pattern matching",
+            pattern[0])
 
     elif pattern[0] == 'id': # variable in pattern add to unifier
         if pattern[1] == '_': # anonymous variable - ignore unifier
@@ -179,8 +263,8 @@ def unify(term, pattern, unifying = True ):
             return []
         else:
             raise PatternMatchFailed(
-                    "expected 'none' got '{}'"
-                    .format(term[0]))
+                    "expected 'none' got '{}'",
+                    term[0])
 
     elif pattern[0] == 'if-exp':
         (IF_EXP, cond_exp, patexp, else_exp) = pattern
@@ -192,7 +276,11 @@ def unify(term, pattern, unifying = True ):
         # if clause and only expose all
         # unifiers if conditional was successful
         state.symbol_table.push_scope({})
-        declare_unifiers(unify(term, patexp, unifying))
+        try:
+            declare_unifiers(unify(term, patexp, unifying))
+        except PatternMatchFailed as e:
+            state.symbol_table.pop_scope()
+            raise e
         bool_val = walk(cond_exp)
         if bool_val[0] != 'boolean':
             raise ValueError("found '{}' expected 'boolean' in conditional pattern"
@@ -214,16 +302,16 @@ def unify(term, pattern, unifying = True ):
                 return []
             else:
                 raise PatternMatchFailed(
-                    "expected a value of type '{}' got a value of type '{}'"
-                    .format(typematch_kind, term[0]))
+                    "expected a value of type '{}' got a value of type '{}'",
+                    typematch_kind, term[0])
         elif typematch_kind == 'function':
             # matching function and member function values
             if term[0] in ['function-val','member-function-val']:
                 return []
             else:
                 raise PatternMatchFailed(
-                    "expected a value of type '{}' got a value of type '{}'"
-                    .format(typematch_kind, term[0]))
+                    "expected a value of type '{}' got a value of type '{}'",
+                    typematch_kind, term[0])
         elif typematch_kind == 'pattern':
             # any kind of structure can be a pattern, and variables
             # see globals.py for a definition of 'patterns'
@@ -231,13 +319,13 @@ def unify(term, pattern, unifying = True ):
                 return []
             else:
                 raise PatternMatchFailed(
-                        "expected a value of type '{}' got a value of type '{}'"
-                        .format(typematch_kind, term[0]))
+                        "expected a value of type '{}' got a value of type '{}'",
+                        typematch_kind, term[0])
         elif term[0] == 'object': # then typematch_kind has to be a structure type
             if state.symbol_table.lookup_sym(typematch_kind)[0] != 'struct':
                 raise PatternMatchFailed( 
-                        "'{}' is not a type"
-                        .format(typematch_kind) )
+                        "'{}' is not a type",
+                        typematch_kind )
             (OBJECT,
                 (STRUCT_ID, (ID, struct_id)),
                 (MEMBER_NAMES, LIST),
@@ -246,15 +334,15 @@ def unify(term, pattern, unifying = True ):
                 return []
             else:
                 raise PatternMatchFailed(
-                    "expected a value of type '{}' got a value of type '{}'"
-                    .format(typematch_kind, struct_id))
+                    "expected a value of type '{}' got a value of type '{}'",
+                    typematch_kind, struct_id)
         else:
             if state.symbol_table.lookup_sym(typematch_kind)[0] != 'struct':
-                raise PatternMatchFailed( "'{}' is not a type".format(typematch_kind) )
+                raise PatternMatchFailed( "'{}' is not a type", typematch_kind )
             else:
                 raise PatternMatchFailed(
-                    "expected a value of type '{}' got a value of type '{}'"
-                    .format(typematch_kind, term[0]))
+                    "expected a value of type '{}' got a value of type '{}'",
+                    typematch_kind, term[0])
 
     elif pattern[0] == 'pattern':
         if term[0] == 'pattern':
@@ -319,8 +407,8 @@ def unify(term, pattern, unifying = True ):
         (OBJECT, (STRUCT_ID, (ID, tid)), tml, (OBJECT_MEMORY, (LIST, tl))) = term
         if pid != tid:
             raise PatternMatchFailed(
-                "pattern type '{}' and term type '{}' do not agree"
-                .format(pid,tid))
+                "pattern type '{}' and term type '{}' do not agree",
+                pid,tid)
         unifiers = []
         # we only pattern match on data members
         tl_data_members = data_only(tl)
@@ -361,8 +449,8 @@ def unify(term, pattern, unifying = True ):
         if not type or type[0] != 'struct':
             raise ValueError("illegal pattern, '{}' is not a type".format(apply_id))
         if struct_id != apply_id:
-            raise PatternMatchFailed("expected type '{}' got type '{}'"
-                .format(apply_id, struct_id))
+            raise PatternMatchFailed("expected type '{}' got type '{}'",
+                apply_id, struct_id)
         # retrieve argument list to constructor
         # Note: we want it to be a list so we can compare it to the object memory
         if arg[0] == 'tuple':
@@ -377,8 +465,8 @@ def unify(term, pattern, unifying = True ):
         (HEAD_TAIL, pattern_head, pattern_tail) = pattern
         if term[0] != 'list':
             raise PatternMatchFailed(
-                "head-tail operator expected a list got a value of type '{}'"
-                .format(term[0]))
+                "head-tail operator expected a list got a value of type '{}'",
+                term[0])
         (LIST, list_val) = term
         if not len(list_val):
             raise PatternMatchFailed(
@@ -395,13 +483,13 @@ def unify(term, pattern, unifying = True ):
     ### 3. AST structural matching
     elif pattern[0] != term[0]:  # node types are not the same
         raise PatternMatchFailed(
-            "nodes '{}' and '{}' are not the same"
-            .format(term[0], pattern[0]))
+            "nodes '{}' and '{}' are not the same",
+            term[0], pattern[0])
 
     elif len(pattern) != len(term): # nodes are not of same the arity
         raise PatternMatchFailed(
-            "nodes '{}' and '{}'' are not of the same arity"
-            .format(term[0], pattern[0]))
+            "nodes '{}' and '{}'' are not of the same arity",
+            term[0], pattern[0])
 
     else: # unify AST children nodes
         unifier = []
@@ -464,6 +552,411 @@ def check_repeated_symbols( unifiers ):
         else: # Else we have never seen this before so we record it.
             symbols[sym] = term
 
+#########################################################################
+# *** The Pattern Compiler ***
+#
+# unify interprets a pattern from scratch every time it is matched.  the
+# pattern compiler translates a pattern once into a matcher, a function
+# that takes a term and either returns the unifier or None if the term
+# does not match the pattern.  matchers are specialized to the shape of
+# the pattern: literal checks, arity checks, type tag tests, and direct
+# variable binding.  patterns whose meaning depends on the run time
+# environment such as first-class patterns are matched by calling unify.
+#
+# failing to match is the common case when selecting function clauses,
+# catch clauses, and filtering in for loops, therefore matchers do not
+# raise PatternMatchFailed.  a failing matcher records the reason for
+# the failure in 'match_failure' and the message is only formatted when
+# the failure is reported, see 'match_pattern'.
+#
+# matchers are cached by pattern identity in a bounded cache, see
+# 'NodeCache' in support.py.
+pattern_cache = NodeCache()
+
+# the reason for the most recent failure of a matcher, either a pair
+# (message format, arguments) or the PatternMatchFailed exception
+# raised by unify.
+match_failure = [None]
+
+def pattern_matcher(pattern):
+    '''
+    return the matcher for the given pattern.
+    '''
+    matcher = pattern_cache.get(pattern)
+    if matcher:
+        return matcher
+    try:
+        (matcher, variables) = compile_pattern(pattern)
+    except Exception:
+        # malformed patterns are reported by unify when they are matched
+        matcher = unify_matcher(pattern)
+    pattern_cache.put(pattern, matcher)
+    return matcher
+
+def try_match(term, pattern):
+    '''
+    match term and pattern, return the unifier or None if the term
+    does not match the pattern.
+    '''
+    return pattern_matcher(pattern)(term)
+
+def match_pattern(term, pattern):
+    '''
+    unify term and pattern using the compiled matcher of the pattern,
+    raises PatternMatchFailed exactly like unify if they do not match.
+    '''
+    unifier = pattern_matcher(pattern)(term)
+    if unifier is None:
+        raise match_failed()
+    return unifier
+
+def match_failed():
+    '''
+    the PatternMatchFailed exception for the most recent failure of a matcher.
+    '''
+    failure = match_failure[0]
+    if isinstance(failure, PatternMatchFailed):
+        return failure
+    else:
+        (format, args) = failure
+        return PatternMatchFailed(format, *args)
+
+def fail(format, *args):
+    match_failure[0] = (format, args)
+    return None
+
+def unify_or_fail(term, pattern):
+    try:
+        return unify(term, pattern)
+    except PatternMatchFailed as e:
+        match_failure[0] = e
+        return None
+
+def unify_matcher(pattern):
+    return lambda term : unify_or_fail(term, pattern)
+
+#########################################################################
+# translate a pattern into a pair (matcher, variables) where 'variables'
+# is the list of variable names the matcher binds.  if the variables
+# bound by a matcher are only known at match time then 'variables' is None.
+def compile_pattern(pattern):
+    type = pattern[0]
+
+    if type == 'id':
+        return compile_variable(pattern)
+
+    elif type == 'index':
+        def match_index(term):
+            if term[0] in unify_not_allowed_terms:
+                return fail_term_not_allowed(term)
+            return [(pattern, term)]
+        return (match_index, [])
+
+    elif type in unify_not_allowed:
+        def match_not_allowed(term):
+            if term[0] in unify_not_allowed_terms:
+                return fail_term_not_allowed(term)
+            return fail("pattern of type '{}' not allowed in pattern matching",
+                        type)
+        return (match_not_allowed, [])
+
+    elif type == 'none':
+        def match_none(term):
+            if term[0] in unify_not_allowed_terms:
+                return fail_term_not_allowed(term)
+            if term[0] == 'none':
+                return []
+            else:
+                return fail("expected 'none' got '{}'", term[0])
+        return (match_none, [])
+
+    elif type in ['integer', 'real', 'boolean', 'string'] and len(pattern) == 2:
+        return compile_literal(pattern)
+
+    elif type in ['list', 'tuple'] and len(pattern) == 2:
+        return compile_sequence(pattern)
+
+    elif type in ['head-tail', 'raw-head-tail']:
+        return compile_head_tail(pattern)
+
+    elif type == 'apply':
+        return compile_constructor(pattern)
+
+    elif type == 'typematch':
+        return compile_typematch(pattern)
+
+    elif type == 'if-exp':
+        return compile_conditional(pattern)
+
+    else:
+        # first-class patterns, constraint patterns, objects, etc.
+        return (unify_matcher(pattern), None)
+
+#########################################################################
+def fail_term_not_allowed(term):
+    return fail("term of type '{}' not allowed in pattern matching", term[0])
+
+def fail_node_mismatch(term, type):
+    return fail("nodes '{}' and '{}' are not the same", term[0], type)
+
+def fail_arity_mismatch(term, type):
+    return fail("nodes '{}' and '{}'' are not of the same arity", term[0], type)
+
+#########################################################################
+# unifiers of a sequence of matchers only need to be checked for repeated
+# variables if the variables are not known at compile time or if a
+# variable occurs more than once.
+def sequence_variables(variable_lists):
+    variables = []
+    for v in variable_lists:
+        if v is None:
+            return (None, True)
+        variables += v
+    return (variables, len(set(variables)) != len(variables))
+
+#########################################################################
+def compile_variable(pattern):
+    (ID, name) = pattern
+
+    if name == '_': # anonymous variable - ignore unifier
+        def match_anonymous(term):
+            if term[0] in unify_not_allowed_terms:
+                return fail_term_not_allowed(term)
+            return []
+        return (match_anonymous, [])
+
+    def match_variable(term):
+        if term[0] in unify_not_allowed_terms:
+            return fail_term_not_allowed(term)
+        id_val = state.symbol_table.lookup_sym(name, strict=False)
+        if id_val and id_val[0] == 'pattern':
+            warning("you are overwriting a pattern stored in '{}'".format(name))
+        return [(pattern, term)]
+    return (match_variable, [name])
+
+#########################################################################
+def compile_literal(pattern):
+    (type, value) = pattern
+    if isinstance(value, str):
+        string_predicate = compile_string_pattern(value)
+
+    def match_literal(term):
+        if term[0] in unify_not_allowed_terms:
+            return fail_term_not_allowed(term)
+        if term[0] != type:
+            return fail_node_mismatch(term, type)
+        if len(term) != 2:
+            return fail_arity_mismatch(term, type)
+        term_value = term[1]
+        if isinstance(term_value, str):
+            if isinstance(value, str) and string_predicate(term_value):
+                return []
+            else:
+                return fail("regular expression '{}' did not match '{}'",
+                            value, term_value)
+        elif isinstance(term_value, (int, float, bool)):
+            if term_value == value:
+                return []
+            else:
+                return fail("'{}' is not the same as '{}'", term_value, value)
+        else:
+            return unify_or_fail(term_value, value)
+    return (match_literal, [])
+
+#########################################################################
+def compile_sequence(pattern):
+    (type, elements) = pattern
+    if not isinstance(elements, list):
+        return (unify_matcher(pattern), None)
+
+    compiled = [compile_pattern(e) for e in elements]
+    matchers = [m for (m, v) in compiled]
+    (variables, check) = sequence_variables([v for (m, v) in compiled])
+    n = len(elements)
+
+    def match_sequence(term):
+        if term[0] in unify_not_allowed_terms:
+            return fail_term_not_allowed(term)
+        if term[0] != type:
+            return fail_node_mismatch(term, type)
+        if len(term) != 2:
+            return fail_arity_mismatch(term, type)
+        term_elements = term[1]
+        if not isinstance(term_elements, list):
+            return unify_or_fail(term, pattern)
+        if len(term_elements) != n:
+            return fail("term and pattern lists/tuples are not the same length")
+        unifier = []
+        for i in range(n):
+            u = matchers[i](term_elements[i])
+            if u is None:
+                return None
+            unifier += u
+        if check:
+            check_repeated_symbols(unifier)
+        return unifier
+    return (match_sequence, variables)
+
+#########################################################################
+def compile_head_tail(pattern):
+    (HEAD_TAIL, pattern_head, pattern_tail) = pattern
+
+    (match_head, head_variables) = compile_pattern(pattern_head)
+    (match_tail, tail_variables) = compile_pattern(pattern_tail)
+    (variables, check) = sequence_variables([head_variables, tail_variables])
+
+    def match_head_tail(term):
+        if term[0] in unify_not_allowed_terms:
+            return fail_term_not_allowed(term)
+        if term[0] != 'list':
+            return fail("head-tail operator expected a list got a value of type '{}'",
+                        term[0])
+        (LIST, list_val) = term
+        if not len(list_val):
+            return fail("head-tail operator expected a non-empty list")
+        unifier = match_head(list_val[0])
+        if unifier is None:
+            return None
+        tail_unifier = match_tail(('list', list_val[1:]))
+        if tail_unifier is None:
+            return None
+        unifier += tail_unifier
+        if check:
+            check_repeated_symbols(unifier)
+        return unifier
+    return (match_head_tail, variables)
+
+#########################################################################
+# in patterns constructor functions match objects, e.g.
+#   let A(x,y) = A(1,2)
+def compile_constructor(pattern):
+    f = pattern[1]
+    if f[0] == 'index':
+        # scope qualified pattern name
+        (APPLY,
+          (INDEX,
+            (ID, modname),
+            (ID, apply_id)),
+          arg) = pattern
+    else:
+        modname = None
+        (APPLY,
+          (ID, apply_id),
+          arg) = pattern
+
+    if arg[0] == 'tuple':
+        arg_list = arg[1]
+    else:
+        arg_list = [arg]
+    compiled = [compile_pattern(a) for a in arg_list]
+    matchers = [m for (m, v) in compiled]
+    (variables, check) = sequence_variables([v for (m, v) in compiled])
+    n = len(arg_list)
+
+    def match_constructor(term):
+        if term[0] != 'object':
+            # let unify produce the appropriate failure
+            return unify_or_fail(term, pattern)
+        (OBJECT,
+         (STRUCT_ID, (ID, struct_id)),
+         (MEMBER_NAMES, (LIST, member_names)),
+         (OBJECT_MEMORY, (LIST, obj_memory))) = term
+        if modname:
+            orig_config = set_module_env(modname)
+        type = state.symbol_table.lookup_sym(apply_id,strict=False)
+        if modname:
+            set_config(orig_config)
+        if not type or type[0] != 'struct':
+            raise ValueError("illegal pattern, '{}' is not a type".format(apply_id))
+        if struct_id != apply_id:
+            return fail("expected type '{}' got type '{}'", apply_id, struct_id)
+        # only pattern match on object data members
+        data_list = data_only(obj_memory)
+        if len(data_list) != n:
+            return fail("term and pattern lists/tuples are not the same length")
+        unifier = []
+        for i in range(n):
+            u = matchers[i](data_list[i])
+            if u is None:
+                return None
+            unifier += u
+        if check:
+            check_repeated_symbols(unifier)
+        return unifier
+    return (match_constructor, variables)
+
+#########################################################################
+def compile_typematch(pattern):
+    typematch_kind = pattern[1]
+
+    if typematch_kind in ['string','real','integer','list','tuple','boolean','none']:
+        def match_type(term):
+            if term[0] in unify_not_allowed_terms:
+                return fail_term_not_allowed(term)
+            if typematch_kind == term[0]:
+                return []
+            else:
+                return fail("expected a value of type '{}' got a value of type '{}'",
+                            typematch_kind, term[0])
+        return (match_type, [])
+
+    elif typematch_kind in ['function', 'pattern']:
+        if typematch_kind == 'function':
+            # matching function and member function values
+            kinds = {'function-val','member-function-val'}
+        else:
+            # any kind of structure can be a pattern, and variables
+            kinds = patterns
+        def match_kind(term):
+            if term[0] in unify_not_allowed_terms:
+                return fail_term_not_allowed(term)
+            if term[0] in kinds:
+                return []
+            else:
+                return fail("expected a value of type '{}' got a value of type '{}'",
+                            typematch_kind, term[0])
+        return (match_kind, [])
+
+    else:
+        # user defined types are looked up when matching
+        return (unify_matcher(pattern), [])
+
+#########################################################################
+def compile_conditional(pattern):
+    (IF_EXP, cond_exp, patexp, else_exp) = pattern
+
+    if else_exp[0] != 'null':
+        return (unify_matcher(pattern), None)
+
+    (match_patexp, patexp_variables) = compile_pattern(patexp)
+
+    def match_conditional(term):
+        if term[0] in unify_not_allowed_terms:
+            return fail_term_not_allowed(term)
+        # evaluate the conditional expression in the
+        # context of the unifiers of the pattern before the
+        # if clause and only expose all
+        # unifiers if conditional was successful
+        state.symbol_table.push_scope({})
+        unifiers = match_patexp(term)
+        if unifiers is None:
+            state.symbol_table.pop_scope()
+            return None
+        declare_unifiers(unifiers)
+        bool_val = walk(cond_exp)
+        if bool_val[0] != 'boolean':
+            raise ValueError("found '{}' expected 'boolean' in conditional pattern"
+                             .format(bool_val[0]))
+        # copy unifiers out of the temporary scope of the
+        # if expression.
+        unifiers = state.symbol_table.get_curr_scope(option="unifiers")
+        state.symbol_table.pop_scope()
+        if bool_val[1]:
+            return unifiers
+        else:
+            return fail("conditional pattern match failed")
+    return (match_conditional, None)
+
 #########################################################################
 # we are indexing into the memory of either a list/tuple/string or an
 # object to read the memory.
@@ -534,7 +1027,13 @@ def read_at_ix(structure_val, ix):
         raise ValueError("term '{}' is not indexable"
                          .format(term2string(structure_val)))
 
-    # index into memory and get value(s)
+    return read_memory(structure_val, memory, ix_val)
+
+#########################################################################
+# index into the memory of a list/tuple/string or an object and get
+# the value(s).
+def read_memory(structure_val, memory, ix_val):
+
     if ix_val[0] == 'integer':
         if structure_val[0] == 'string':
             return ('string', memory[ix_val[1]])
@@ -663,340 +1162,408 @@ def set_config(config):
 # part of the interpreter proper.  for other builtins that do 
 # not have this restriction see the prologue.
 
-def handle_builtins(node):
-    (APPLY, (ID, opname), args) = node
-    assert_match(APPLY, 'apply')
-    assert_match(ID, 'id')
-
-    # deal with binary operators
-    if opname in binary_operators:
-        (TUPLE, [a,b])= args
-
-        if opname == '__plus__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real', 'list', 'string']:
-                if val_b[0] in ['integer', 'real', 'list', 'string']:
-                    if val_a[0]==val_b[0]:
-                        return (val_a[0], val_a[1] + val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} + {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} + {}' expected '{} + {}'"
-                                .format(val_a[0],val_b[0],type,type))
-                else:
-                    raise ValueError("unsupported type '{}' in '+'".format(val_b[0]))
+#########################################################################
+def builtin_plus(val_a, val_b):
+    if val_a[0] in ['integer', 'real', 'list', 'string']:
+        if val_b[0] in ['integer', 'real', 'list', 'string']:
+            if val_a[0]==val_b[0]:
+                n = val_a[1] + val_b[1]
+                if val_a[0] == 'integer' and -5 <= n <= 256:
+                    return small_integers[n+5]
+                return (val_a[0], n)
             else:
-                raise ValueError("unsupported type '{}' in '+'".format(val_a[0]))
-        elif opname == '__minus__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real']:
-                if val_b[0] in ['integer', 'real']:
-                    if val_a[0]==val_b[0]:
-                        return (val_a[0], val_a[1] - val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} - {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} - {}' expected '{} - {}'"
-                                .format(val_a[0],val_b[0],type,type))
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} + {}' not supported"
+                        .format(val_a[0],val_b[0]))
                 else:
-                    raise ValueError("unsupported type '{}' in '-'".format(val_b[0]))
+                    raise ValueError(
+                        "found '{} + {}' expected '{} + {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '+'".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '+'".format(val_a[0]))
+
+#########################################################################
+def builtin_minus(val_a, val_b):
+    if val_a[0] in ['integer', 'real']:
+        if val_b[0] in ['integer', 'real']:
+            if val_a[0]==val_b[0]:
+                n = val_a[1] - val_b[1]
+                if val_a[0] == 'integer' and -5 <= n <= 256:
+                    return small_integers[n+5]
+                return (val_a[0], n)
             else:
-                raise ValueError("unsupported type '{}' in '-'".format(val_a[0]))
-        elif opname == '__times__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real']:
-                if val_b[0] in ['integer', 'real']:
-                    if val_a[0]==val_b[0]:
-                        return (val_a[0], val_a[1] * val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} * {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} * {}' expected '{} * {}'"
-                                .format(val_a[0],val_b[0],type,type))
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} - {}' not supported"
+                        .format(val_a[0],val_b[0]))
                 else:
-                    raise ValueError("unsupported type '{}' in '*'".format(val_b[0]))
+                    raise ValueError(
+                        "found '{} - {}' expected '{} - {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '-'".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '-'".format(val_a[0]))
+
+#########################################################################
+def builtin_times(val_a, val_b):
+    if val_a[0] in ['integer', 'real']:
+        if val_b[0] in ['integer', 'real']:
+            if val_a[0]==val_b[0]:
+                n = val_a[1] * val_b[1]
+                if val_a[0] == 'integer' and -5 <= n <= 256:
+                    return small_integers[n+5]
+                return (val_a[0], n)
             else:
-                raise ValueError("unsupported type '{}' in '*'".format(val_a[0]))
-        elif opname == '__divide__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real']:
-                if val_b[0] in ['integer', 'real']:
-                    if val_a[0]==val_b[0]:
-                        if val_a[0] == 'integer':
-                            return ('integer', val_a[1] // val_b[1])
-                        elif val_a[0] == 'real':
-                            return ('real', val_a[1] / val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} / {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} / {}' expected '{} / {}'"
-                                .format(val_a[0],val_b[0],type,type))
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} * {}' not supported"
+                        .format(val_a[0],val_b[0]))
                 else:
-                    raise ValueError("unsupported type '{}' in '/'".format(val_b[0]))
-            else:
-                raise ValueError("unsupported type '{}' in '/'".format(val_a[0]))
-        elif opname == '__or__':
-            # short circuit evaluation
-            val_a = walk(a)
-            if val_a[0] == 'boolean':
-                if val_a[1] == True:
-                    return ('boolean', True)
-            else:
-                raise ValueError(
-                    "found '{} expected 'boolean and boolean'"
-                    .format(val_a[0]))
-            val_b = walk(b)
-            if val_b[0] == 'boolean':
-                return ('boolean', val_a[1] or val_b[1])
-            else:
-                raise ValueError(
-                    "found '{} and {}' expected 'boolean and boolean'"
-                    .format(val_a[0],val_b[0]))
-        elif opname == '__and__':
-            # short circuit evaluation
-            val_a = walk(a)
-            if val_a[0] == 'boolean':
-                if val_a[1] == False:
-                    return ('boolean', False)
-            else:
-                raise ValueError(
-                    "found '{} expected 'boolean and boolean'"
-                    .format(val_a[0]))
-            val_b = walk(b)
-            if val_b[0] == 'boolean':
-                return ('boolean', val_a[1] and val_b[1])
+                    raise ValueError(
+                        "found '{} * {}' expected '{} * {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '*'".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '*'".format(val_a[0]))
+
+#########################################################################
+def builtin_divide(val_a, val_b):
+    if val_a[0] in ['integer', 'real']:
+        if val_b[0] in ['integer', 'real']:
+            if val_a[0]==val_b[0]:
+                if val_a[0] == 'integer':
+                    return integer_value(val_a[1] // val_b[1])
+                elif val_a[0] == 'real':
+                    return ('real', val_a[1] / val_b[1])
             else:
-                raise ValueError(
-                    "found '{} and {}' expected 'boolean and boolean'"
-                    .format(val_a[0],val_b[0]))
-        elif opname == '__eq__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real', 'list', 'tuple', 'boolean', 'string', 'none']:
-                if val_b[0] in ['integer', 'real', 'list', 'tuple', 'boolean', 'string', 'none']:
-                    if val_a[0]==val_b[0]:
-                        if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
-                            warning("possible rounding error issue")
-                        return ('boolean', val_a[1] == val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} == {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} == {}' expected '{} == {}'"
-                                .format(val_a[0],val_b[0],type,type))
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} / {}' not supported"
+                        .format(val_a[0],val_b[0]))
                 else:
-                    raise ValueError("unsupported type '{}' in '=='".format(val_b[0]))
+                    raise ValueError(
+                        "found '{} / {}' expected '{} / {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '/'".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '/'".format(val_a[0]))
+
+#########################################################################
+def builtin_eq(val_a, val_b):
+    if val_a[0] in ['integer', 'real', 'list', 'tuple', 'boolean', 'string', 'none']:
+        if val_b[0] in ['integer', 'real', 'list', 'tuple', 'boolean', 'string', 'none']:
+            if val_a[0]==val_b[0]:
+                if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
+                    warning("possible rounding error issue")
+                return true_value if val_a[1] == val_b[1] else false_value
             else:
-                raise ValueError("unsupported type '{}' in '=='".format(val_a[0]))
-        elif opname  == '__ne__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real', 'list', 'tuple', 'boolean', 'string', 'none']:
-                if val_b[0] in ['integer', 'real', 'list', 'tuple', 'boolean', 'string', 'none']:
-                    if val_a[0]==val_b[0]:
-                        if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
-                            warning("possible rounding error issue")
-                        return ('boolean', val_a[1] != val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} =/= {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} =/= {}' expected '{} =/= {}'"
-                                .format(val_a[0],val_b[0],type,type))
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} == {}' not supported"
+                        .format(val_a[0],val_b[0]))
                 else:
-                    raise ValueError("unsupported type '{}' in '=/='".format(val_b[0]))
+                    raise ValueError(
+                        "found '{} == {}' expected '{} == {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '=='".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '=='".format(val_a[0]))
+
+#########################################################################
+def builtin_ne(val_a, val_b):
+    if val_a[0] in ['integer', 'real', 'list', 'tuple', 'boolean', 'string', 'none']:
+        if val_b[0] in ['integer', 'real', 'list', 'tuple', 'boolean', 'string', 'none']:
+            if val_a[0]==val_b[0]:
+                if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
+                    warning("possible rounding error issue")
+                return true_value if val_a[1] != val_b[1] else false_value
             else:
-                raise ValueError("unsupported type '{}' in '=/='".format(val_a[0]))
-        elif opname == '__le__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real', 'string']:
-                if val_b[0] in ['integer', 'real', 'string']:
-                    if val_a[0]==val_b[0]:
-                        if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
-                            warning("possible rounding error issue")
-                        return ('boolean', val_a[1] <= val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} <= {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} <= {}' expected '{} <= {}'"
-                                .format(val_a[0],val_b[0],type,type))
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} =/= {}' not supported"
+                        .format(val_a[0],val_b[0]))
                 else:
-                    raise ValueError("unsupported type '{}' in '<='".format(val_b[0]))
+                    raise ValueError(
+                        "found '{} =/= {}' expected '{} =/= {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '=/='".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '=/='".format(val_a[0]))
+
+#########################################################################
+def builtin_le(val_a, val_b):
+    if val_a[0] in ['integer', 'real', 'string']:
+        if val_b[0] in ['integer', 'real', 'string']:
+            if val_a[0]==val_b[0]:
+                if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
+                    warning("possible rounding error issue")
+                return true_value if val_a[1] <= val_b[1] else false_value
             else:
-                raise ValueError("unsupported type '{}' in '<='".format(val_a[0]))
-        elif opname == '__lt__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real', 'string']:
-                if val_b[0] in ['integer', 'real', 'string']:
-                    if val_a[0]==val_b[0]:
-                        if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
-                            warning("possible rounding error issue")
-                        return ('boolean', val_a[1] < val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} < {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} < {}' expected '{} < {}'"
-                                .format(val_a[0],val_b[0],type,type))
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} <= {}' not supported"
+                        .format(val_a[0],val_b[0]))
                 else:
-                    raise ValueError("unsupported type '{}' in '<'".format(val_b[0]))
+                    raise ValueError(
+                        "found '{} <= {}' expected '{} <= {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '<='".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '<='".format(val_a[0]))
+
+#########################################################################
+def builtin_lt(val_a, val_b):
+    if val_a[0] in ['integer', 'real', 'string']:
+        if val_b[0] in ['integer', 'real', 'string']:
+            if val_a[0]==val_b[0]:
+                if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
+                    warning("possible rounding error issue")
+                return true_value if val_a[1] < val_b[1] else false_value
             else:
-                raise ValueError("unsupported type '{}' in '<'".format(val_a[0]))
-        elif opname == '__ge__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real', 'string']:
-                if val_b[0] in ['integer', 'real', 'string']:
-                    if val_a[0]==val_b[0]:
-                        if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
-                            warning("possible rounding error issue")
-                        return ('boolean', val_a[1] >= val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} >= {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} >= {}' expected '{} >= {}'"
-                                .format(val_a[0],val_b[0],type,type))
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} < {}' not supported"
+                        .format(val_a[0],val_b[0]))
                 else:
-                    raise ValueError("unsupported type '{}' in '>='".format(val_b[0]))
+                    raise ValueError(
+                        "found '{} < {}' expected '{} < {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '<'".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '<'".format(val_a[0]))
+
+#########################################################################
+def builtin_ge(val_a, val_b):
+    if val_a[0] in ['integer', 'real', 'string']:
+        if val_b[0] in ['integer', 'real', 'string']:
+            if val_a[0]==val_b[0]:
+                if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
+                    warning("possible rounding error issue")
+                return true_value if val_a[1] >= val_b[1] else false_value
             else:
-                raise ValueError("unsupported type '{}' in '>='".format(val_a[0])) 
-        elif opname == '__gt__':
-            val_a = walk(a)
-            val_b = walk(b)
-            if val_a[0] in ['integer', 'real', 'string']:
-                if val_b[0] in ['integer', 'real', 'string']:
-                    if val_a[0]==val_b[0]:
-                        if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
-                            warning("possible rounding error issue")
-                        return ('boolean', val_a[1] > val_b[1])
-                    else:
-                        type = promote(val_a[0], val_b[0])
-                        if type == None:
-                            raise ValueError(
-                                "operation '{} > {}' not supported"
-                                .format(val_a[0],val_b[0]))
-                        else:
-                            raise ValueError(
-                                "found '{} > {}' expected '{} > {}'"
-                                .format(val_a[0],val_b[0],type,type))
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} >= {}' not supported"
+                        .format(val_a[0],val_b[0]))
                 else:
-                    raise ValueError("unsupported type '{}' in '>'".format(val_b[0]))
+                    raise ValueError(
+                        "found '{} >= {}' expected '{} >= {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '>='".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '>='".format(val_a[0])) 
+
+#########################################################################
+def builtin_gt(val_a, val_b):
+    if val_a[0] in ['integer', 'real', 'string']:
+        if val_b[0] in ['integer', 'real', 'string']:
+            if val_a[0]==val_b[0]:
+                if val_a[0] == 'real' and val_a[1] != val_b[1] and isclose(val_a[1],val_b[1]):
+                    warning("possible rounding error issue")
+                return true_value if val_a[1] > val_b[1] else false_value
             else:
-                raise ValueError("unsupported type '{}' in '>'".format(val_a[0])) 
+                type = promote(val_a[0], val_b[0])
+                if type == None:
+                    raise ValueError(
+                        "operation '{} > {}' not supported"
+                        .format(val_a[0],val_b[0]))
+                else:
+                    raise ValueError(
+                        "found '{} > {}' expected '{} > {}'"
+                        .format(val_a[0],val_b[0],type,type))
+        else:
+            raise ValueError("unsupported type '{}' in '>'".format(val_b[0]))
+    else:
+        raise ValueError("unsupported type '{}' in '>'".format(val_a[0])) 
+
+#########################################################################
+# the logical operators evaluate their second argument only when needed,
+# therefore the second argument is passed as a function computing its value.
+def builtin_or(val_a, eval_b):
+    # short circuit evaluation
+    if val_a[0] == 'boolean':
+        if val_a[1] == True:
+            return true_value
+    else:
+        raise ValueError(
+            "found '{} expected 'boolean and boolean'"
+            .format(val_a[0]))
+    val_b = eval_b()
+    if val_b[0] == 'boolean':
+        return true_value if val_a[1] or val_b[1] else false_value
+    else:
+        raise ValueError(
+            "found '{} and {}' expected 'boolean and boolean'"
+            .format(val_a[0],val_b[0]))
+
+#########################################################################
+def builtin_and(val_a, eval_b):
+    # short circuit evaluation
+    if val_a[0] == 'boolean':
+        if val_a[1] == False:
+            return false_value
+    else:
+        raise ValueError(
+            "found '{} expected 'boolean and boolean'"
+            .format(val_a[0]))
+    val_b = eval_b()
+    if val_b[0] == 'boolean':
+        return true_value if val_a[1] and val_b[1] else false_value
+    else:
+        raise ValueError(
+            "found '{} and {}' expected 'boolean and boolean'"
+            .format(val_a[0],val_b[0]))
+
+#########################################################################
+def builtin_not(arg_val):
+    if arg_val[0] == 'boolean':
+        if arg_val[1] == False:
+            return true_value
+        else:
+            return false_value
+    else:
+        raise ValueError("found 'not {}' expected 'not boolean'"
+                         .format(arg_val[0]))
+
+#########################################################################
+def builtin_uminus(arg_val):
+    if arg_val[0] == 'integer':
+        return integer_value(- arg_val[1])
+    elif arg_val[0] == 'real':
+        return ('real', - arg_val[1])
+    else:
+        raise ValueError(
+            "unsupported type '{}' in unary minus"
+            .format(arg_val[0]))
+
+#########################################################################
+def builtin_uplus(arg_val):
+    if arg_val[0] in ['integer', 'real']:
+        return (arg_val[0], + arg_val[1])
+    else:
+        raise ValueError(
+            "unsupported type '{}' in unary plus"
+            .format(arg_val[0]))
+
+#########################################################################
+def builtin_assert(arg_val):
+    if arg_val[0] != 'boolean':
+        raise ValueError('the assert operator expected a Boolean value')
+    if not arg_val[1]:
+        raise ValueError('assert failed')
+    else:
+        return ('none', None)
+
+#########################################################################
+def builtin_escape(arg_val):
+    global __retval__
+    __retval__ = ('none', None)
+    if arg_val[0] != 'string':
+        raise ValueError('expected a string as argument to the escape operator')
+    (code, hoisted) = compile_escape(arg_val[1])
+    exec(code, globals(), dict(hoisted))
+    return __retval__
+
+#########################################################################
+def builtin_eval(arg_val):
+    if arg_val[0] == 'string':
+        import frontend
+        parser = frontend.Parser(filename="<eval>")
+        eval_ast = parser.parse(arg_val[1])
+        return completed(walk(eval_ast))
+    else:
+        raise ValueError('expected a string as argument to the eval operator')
+
+#########################################################################
+def builtin_toplevel(arg_val):
+    if arg_val[0] != 'none':
+        raise ValueError("toplevel is a nullary operator")
+    return boolean_value(state.mainmodule == state.lineinfo[0])
+
+#########################################################################
+# tables mapping the builtin operator symbols to their implementations.
+# the and/or operators are short-circuited and therefore do not appear
+# in the binary operator table.
+binary_operator_functions = {
+    '__plus__'      : builtin_plus,
+    '__minus__'     : builtin_minus,
+    '__times__'     : builtin_times,
+    '__divide__'    : builtin_divide,
+    '__eq__'        : builtin_eq,
+    '__ne__'        : builtin_ne,
+    '__le__'        : builtin_le,
+    '__lt__'        : builtin_lt,
+    '__ge__'        : builtin_ge,
+    '__gt__'        : builtin_gt,
+}
+
+short_circuit_functions = {
+    '__or__'        : builtin_or,
+    '__and__'       : builtin_and,
+}
+
+unary_operator_functions = {
+    '__not__'       : builtin_not,
+    '__uminus__'    : builtin_uminus,
+    '__uplus__'     : builtin_uplus,
+    'assert'        : builtin_assert,
+    'escape'        : builtin_escape,
+    'eval'          : builtin_eval,
+}
+
+nullary_operator_functions = {
+    'toplevel'      : builtin_toplevel,
+}
+
+#########################################################################
+def handle_builtins(node):
+    (APPLY, (ID, opname), args) = node
+    assert_match(APPLY, 'apply')
+    assert_match(ID, 'id')
+
+    # deal with binary operators
+    if opname in binary_operators:
+        (TUPLE, [a,b])= args
+        if opname in short_circuit_functions:
+            return short_circuit_functions[opname](walk(a), lambda : walk(b))
+        elif opname in binary_operator_functions:
+            return binary_operator_functions[opname](walk(a), walk(b))
         else:
             raise ValueError("unknown builtin binary operator '{}'".format(opname))
 
     # deal with unary operators
     elif opname in unary_operators:
-        arg_val = walk(args)             
-        if opname == '__not__':
-            if arg_val[0] == 'boolean':
-                if arg_val[1] == False:
-                    return ('boolean', True)
-                else:
-                    return ('boolean', False)
-            else:
-                raise ValueError("found 'not {}' expected 'not boolean'"
-                                 .format(arg_val[0]))
-        elif opname == '__uminus__':
-            if arg_val[0] in ['integer', 'real']:
-                return (arg_val[0], - arg_val[1])
-            else:
-                raise ValueError(
-                    "unsupported type '{}' in unary minus"
-                    .format(arg_val[0]))
-        elif opname == '__uplus__':
-            if arg_val[0] in ['integer', 'real']:
-                return (arg_val[0], + arg_val[1])
-            else:
-                raise ValueError(
-                    "unsupported type '{}' in unary plus"
-                    .format(arg_val[0]))
-        elif opname == 'assert':
-            if arg_val[0] != 'boolean':
-                raise ValueError('the assert operator expected a Boolean value')
-            if not arg_val[1]:
-                raise ValueError('assert failed')
-            else:
-                return ('none', None)
-        elif opname == 'escape':
-            global __retval__
-            __retval__ = ('none', None)
-            if arg_val[0] != 'string':
-                raise ValueError('expected a string as argument to the escape operator')
-            exec(arg_val[1])
-            return __retval__
-        elif opname == 'eval':
-            if arg_val[0] == 'string':
-                import frontend
-                parser = frontend.Parser(filename="<eval>")
-                eval_ast = parser.parse(arg_val[1])
-                walk(eval_ast)
-                return function_return_value[-1]
-            else:
-                raise ValueError('expected a string as argument to the eval operator')
-
+        if opname in unary_operator_functions:
+            return unary_operator_functions[opname](walk(args))
         else:
             raise ValueError("unknown builtin unary operator '{}'".format(opname))
 
     # deal with nullary operators
     elif opname in nullary_operators:
-        (type, _) = walk(args)
-        if type != 'none':
-            raise ValueError("{} is a nullary operator".format(opname))
-        if opname == 'toplevel':
-            return ('boolean', state.mainmodule == state.lineinfo[0])
+        if opname in nullary_operator_functions:
+            return nullary_operator_functions[opname](walk(args))
         else:
             raise ValueError("unknown builtin nullary operator '{}'".format(opname))
-        
 
 #########################################################################
 def pop_stackframe(error_trace=False): 
@@ -1007,117 +1574,329 @@ def pop_stackframe(error_trace=False):
         state.error_trace = copy(state.trace_stack)
     state.trace_stack.pop()
 
+#########################################################################
+# native functions are called directly on the argument value, there is
+# no Asteroid stack frame.  in case of an error we leave a trace that
+# looks like the one a call of an Asteroid function would leave.
+# native member functions are also passed the object reference.
+def handle_native_call(impl, actual_val_args, fname, *obj_ref):
+    try:
+        result = impl(*obj_ref, actual_val_args)
+    except Exception as e:
+        (module, lineno) = state.lineinfo
+        state.error_trace = state.trace_stack + [(module, lineno, fname)]
+        raise e
+    if result is None:
+        (module, lineno) = state.lineinfo
+        state.error_trace = state.trace_stack + [(module, lineno, fname)]
+        raise ValueError("actual argument '{}' not recognized by function '{}'"
+                         .format(term2string(actual_val_args),fname))
+    return result
+
+#########################################################################
+# the clause index of a function.  the clauses of a function are tried
+# in order and every clause that fails raises PatternMatchFailed.  the
+# index looks at the top-level discriminator of each clause pattern,
+#
+#   * literal patterns:     the value tag and, except for strings, the value
+#   * constructor patterns: the name of the structure
+#   * tuple patterns:       the arity of the tuple
+#   * list, head-tail, typematch and 'none' patterns: the value tag
+#
+# and selects the clauses that can possibly match a given argument value
+# in declaration order.  all other patterns, e.g. variables, conditional,
+# and first-class patterns, are candidates for every argument.
+#
+# the index is built once for each body list and the candidate clauses
+# are computed once for each discriminator of an argument value that
+# appears in the clause patterns, argument values with other
+# discriminators share the candidates of their value tag.  constructor
+# patterns for other structures are the exception, whether the name of
+# the constructor is bound to a structure is checked at each call.  the
+# indexes are kept in a bounded cache, see 'NodeCache' in support.py.
+clause_index_cache = NodeCache()
+
+def clause_candidates(body_list_val, term):
+    '''
+    return the positions of the clauses in the body list that can
+    match the given argument value.
+    '''
+    if len(body_list_val) <= 2:
+        return range(0, len(body_list_val), 2)
+    index = clause_index_cache.get(body_list_val)
+    if not index:
+        index = clause_index(body_list_val)
+        clause_index_cache.put(body_list_val, index)
+
+    (discriminators, values, candidates) = index
+    tag = term[0]
+    value = term_discriminator(term)
+    if tag not in values or value not in values[tag]:
+        value = None
+    key = (tag, value)
+    entry = candidates.get(key)
+    if entry is None:
+        entry = candidate_clauses(discriminators, tag, value)
+        candidates[key] = entry
+    (positions, constructors) = entry
+    if constructors:
+        # constructor names are checked each time, they can be rebound
+        return [i for (i, name) in positions
+                if name is None or not is_struct_name(name)]
+    return positions
+
+def candidate_clauses(discriminators, tag, value):
+    # the candidate clauses for a (tag, value) pair as a pair (positions,
+    # constructors).  if 'constructors' is true then 'positions' is a list
+    # of pairs (i, name) where name is the name of a constructor pattern
+    # that is a candidate only if the name is not bound to a structure,
+    # None for the other candidates.  otherwise 'positions' is the list of
+    # the positions of the candidates.
+    positions = []
+    constructors = False
+    for (i, d) in discriminators:
+        if d and d[0] == 'object' and tag == 'object' and d[1] != value:
+            # a constructor pattern whose name is not a structure reports
+            # an error when matched against an object, keep it as a candidate.
+            positions.append((i, d[1]))
+            constructors = True
+        elif clause_may_match(d, tag, value):
+            positions.append((i, None))
+    if constructors:
+        return (positions, True)
+    return ([i for (i, name) in positions], False)
+
+def is_struct_name(name):
+    type = state.symbol_table.lookup_sym(name, strict=False)
+    return bool(type) and type[0] == 'struct'
+
+def clause_index(body_list_val):
+    # an index is a triple (discriminators, values, candidates) where
+    # 'discriminators' is the list of clause positions and their
+    # discriminators, 'values' maps a value tag to the discriminating
+    # values of that tag, and 'candidates' is the memo of the candidate
+    # clauses for a (tag, value) pair.
+    discriminators = []
+    values = dict()
+    for i in range(0, len(body_list_val), 2):
+        (BODY, (PATTERN, p), stmts) = body_list_val[i+1]
+        d = pattern_discriminator(p)
+        discriminators.append((i, d))
+        if d and d[1] is not None:
+            values.setdefault(d[0], set()).add(d[1])
+    return (discriminators, values, dict())
+
+def pattern_discriminator(p):
+    # the discriminator of a pattern is a pair (tag, value) where a value
+    # of None only discriminates on the tag, or None for patterns that
+    # need to be tried on every value.
+    type = p[0]
+    if type in ['integer', 'real', 'boolean'] and len(p) == 2 \
+       and isinstance(p[1], (int, float, bool)):
+        return (type, p[1])
+    elif type == 'string' and len(p) == 2:
+        return ('string', None)
+    elif type == 'none':
+        return ('none', None)
+    elif type == 'tuple' and len(p) == 2 and isinstance(p[1], list):
+        return ('tuple', len(p[1]))
+    elif type == 'list' and len(p) == 2 and isinstance(p[1], list):
+        return ('list', None)
+    elif type in ['head-tail', 'raw-head-tail']:
+        return ('list', None)
+    elif type == 'apply' and p[1][0] == 'id':
+        return ('object', p[1][1])
+    elif type == 'typematch' and \
+         p[1] in ['string','real','integer','list','tuple','boolean','none']:
+        return (p[1], None)
+    else:
+        return None
+
+def term_discriminator(term):
+    type = term[0]
+    if type in ['integer', 'real', 'boolean']:
+        return term[1]
+    elif type == 'tuple':
+        return len(term[1])
+    elif type == 'object':
+        return term[1][1][1]
+    else:
+        return None
+
+def clause_may_match(d, tag, value):
+    if not d:
+        return True
+    else:
+        return d[0] == tag and (d[1] is None or d[1] == value)
+
 #########################################################################
 def handle_call(obj_ref, fval, actual_val_args, fname):
 
+    (FUNCTION_VAL, body_list, closure) = fval
+    assert_match(FUNCTION_VAL, 'function-val')
+
+    if body_list[0] == 'native':
+        return handle_native_call(body_list[1], actual_val_args, fname)
+    elif body_list[0] == 'native-member':
+        if obj_ref is None:
+            raise ValueError("member function '{}' called without an object"
+                             .format(fname))
+        return handle_native_call(body_list[1], actual_val_args, fname, obj_ref)
+
     # function calls transfer control - save our caller's lineinfo
     # we save the debug information here to preserve lineinfo between
     # function calls between files.
     old_lineinfo = state.lineinfo
 
-    (FUNCTION_VAL, body_list, closure) = fval
-    assert_match(FUNCTION_VAL, 'function-val')
-
-    state.trace_stack.append((state.lineinfo[0],
-                              state.lineinfo[1],
-                              fname))
-
-    # static scoping for functions
-    # Note: we have to do this here because unifying
-    # over the body patterns can introduce variable declarations,
-    # think conditional pattern matching.
-    # Note: we are keeping a stack of configs so that
-    # the debugger can look at contents of 
-    # Asteroid stack frames
-    state.symbol_table.saved_configs.append(
-        state.symbol_table.get_config()
-    )
-    state.symbol_table.set_config(closure)
-    state.symbol_table.push_scope({})
+    # a function that returns with a tail call hands the call back to
+    # us, see 'tail_call'.  we make the call in place of the returning
+    # function so that chains of tail calls run in constant stack space.
+    # the trace stack keeps the frames of the first 'tail_trace_limit'
+    # tail calls of a chain as logical frames.
+    tail_frames = 0
+
+    while True:
+        state.trace_stack.append((state.lineinfo[0],
+                                  state.lineinfo[1],
+                                  fname))
+
+        # static scoping for functions
+        # Note: we have to do this here because unifying
+        # over the body patterns can introduce variable declarations,
+        # think conditional pattern matching.
+        # Note: we are keeping a stack of configs so that
+        # the debugger can look at contents of 
+        # Asteroid stack frames
+        state.symbol_table.saved_configs.append(
+            state.symbol_table.get_config()
+        )
+        state.symbol_table.set_config(closure)
+        state.symbol_table.push_scope({})
 
-    # if we have an obj reference bind it to the
-    # variable 'this'
-    if obj_ref:
-        state.symbol_table.enter_sym('this', obj_ref)
+        # if we have an obj reference bind it to the
+        # variable 'this'
+        if obj_ref:
+            state.symbol_table.enter_sym('this', obj_ref)
 
-    # iterate over the bodies to find one that unifies with the actual parameters
-    (BODY_LIST, (LIST, body_list_val)) = body_list
-    unified = False
+        # iterate over the bodies to find one that unifies with the actual parameters
+        (BODY_LIST, (LIST, body_list_val)) = body_list
+        unifiers = None
 
-    for i in range(0, len(body_list_val), 2):
-        # Process lineinfo
-        lineinfo = body_list_val[ i ]
-        process_lineinfo(lineinfo)
+        for i in clause_candidates(body_list_val, actual_val_args):
+            # Process lineinfo
+            lineinfo = body_list_val[ i ]
+            process_lineinfo(lineinfo)
 
-        # Deconstruct function body
-        (BODY,
-          (PATTERN, p),
-          stmts) = body_list_val[ i + 1]
+            # Deconstruct function body
+            (BODY,
+              (PATTERN, p),
+              stmts) = body_list_val[ i + 1]
 
-        try:
             # Attempt to unify the actual args and the pattern
-            unifiers = unify(actual_val_args, p)
-            unified = True
-        except PatternMatchFailed:
-            unifiers = []
-            unified = False
-
-        if unified:
-            break
+            unifiers = try_match(actual_val_args, p)
+            if unifiers is not None:
+                break
 
-    if not unified:
-        raise ValueError("actual argument '{}' not recognized by function '{}'"
-                         .format(term2string(actual_val_args),fname))
-    declare_formal_args(unifiers)
+        if unifiers is None:
+            # report the error at the last clause of the function
+            process_lineinfo(body_list_val[-2])
+            raise ValueError("actual argument '{}' not recognized by function '{}'"
+                             .format(term2string(actual_val_args),fname))
+        declare_formal_args(unifiers)
 
-    # OWM: The following segment is a repeat of the bottom of this function.
-    # We need to do this because redundant patterns can break scope and
-    # some debugger and state features as they exit computation.
+        # OWM: The following segment is a repeat of the bottom of this function.
+        # We need to do this because redundant patterns can break scope and
+        # some debugger and state features as they exit computation.
 
-    # Check for useless patterns
-    try:
-        if state.eval_redundancy:
-            check_redundancy(body_list, fname)
-
-    # Reset settings
-    except RedundantPatternFound as r:
-        # restore caller's env
-        state.lineinfo = old_lineinfo
-        pop_stackframe()
-        raise r
-
-    # execute the function
-    if state.debugger: state.debugger.enter_function(fname)
-    global function_return_value
-    try:
-        function_return_value.append(None)
-        walk(stmts)
-        val = function_return_value.pop()
-        if val:
-            return_value = val
+        # Check for useless patterns
+        try:
+            if state.eval_redundancy:
+                check_redundancy(body_list, fname)
+
+        # Reset settings
+        except RedundantPatternFound as r:
+            # restore caller's env
+            state.lineinfo = old_lineinfo
+            pop_stackframe()
+            pop_tail_frames(tail_frames)
+            raise r
+
+        # execute the function
+        if state.debugger: state.debugger.enter_function(fname)
+        try:
+            completion = engines[state.engine](stmts)
+
+        except ReturnValue as val:
+            # a return statement in eval'ed code returns from the function
+            completion = val
+
+        except Exception as e:
+            # we got some other kind of exception within the function call
+            # clean up our runtime stack and rethrow
+            # Note: do not reset lineinfo, this way the state points at the source 
+            # of the exception
+            pop_stackframe(error_trace=True)
+            pop_tail_frames(tail_frames)
+            raise e
+
+        if isinstance(completion, TailCall):
+            # replace the frame of this function with the frame of the
+            # called function
+            call = completion
+            state.symbol_table.pop_scope()
+            state.symbol_table.set_config(state.symbol_table.saved_configs.pop())
+            if tail_frames < tail_trace_limit:
+                tail_frames += 1
+            else:
+                state.trace_stack.pop()
+            obj_ref = call.obj_ref
+            fval = call.fval
+            (FUNCTION_VAL, body_list, closure) = fval
+            actual_val_args = call.args
+            fname = call.fname
+            continue
+        elif isinstance(completion, ReturnValue):
+            return_value = completion.value
+        elif completion:
+            return_value = completion
         else:
             return_value = ('none', None)
 
-    except ReturnValue as val:
-        # we got here because a return statement threw a return object
-        function_return_value.pop()
-        return_value = val.value
-
-    except Exception as e:
-        # we got some other kind of exception within the function call
-        # clean up our runtime stack and rethrow
-        # Note: do not reset lineinfo, this way the state points at the source 
-        # of the exception
-        pop_stackframe(error_trace=True)
-        raise e
+        break
 
     # all done with function call -- clean up and exit
     # restore caller's env
     if state.debugger: state.debugger.exit_function(fname)
     state.lineinfo = old_lineinfo
     pop_stackframe()
+    pop_tail_frames(tail_frames)
     return return_value
 
+#########################################################################
+# the number of logical frames of a chain of tail calls kept on the trace stack
+tail_trace_limit = 10
+
+def pop_tail_frames(tail_frames):
+    if tail_frames:
+        del state.trace_stack[-tail_frames:]
+
+#########################################################################
+# the completion that returns the value of applying f_val to arg_val from
+# a function.  calls of Asteroid functions are returned as tail calls and
+# made by 'handle_call' after the returning function has been popped off
+# the stack, all other functions are applied right away.
+def tail_call(f, f_name, f_val, arg_val):
+    if f_val[0] == 'member-function-val':
+        (MEMBER_FUNCTION_VAL, obj_ref, function_val) = f_val
+    else:
+        (obj_ref, function_val) = (None, f_val)
+    if state.debugger \
+       or function_val[0] != 'function-val' \
+       or function_val[1][0] in ['native', 'native-member']:
+        # the debugger follows the nesting of function calls
+        return ReturnValue(apply_function(f, f_name, f_val, arg_val))
+    return TailCall(obj_ref, function_val, arg_val, f_name)
+
 #########################################################################
 def declare_unifiers(unifiers):
     # walk the unifiers and bind name-value pairs into the symtab
@@ -1154,10 +1933,28 @@ def declare_unifiers(unifiers):
 #########################################################################
 def stmt_list(node):
 
-    (STMT_LIST, stmts) = node
+    (STMT_LIST, (LIST, stmts)) = node
     assert_match(STMT_LIST, 'stmt-list')
-    
-    walk(stmts)
+    assert_match(LIST, 'list')
+
+    completion = None
+    for stmt in stmts:
+        if stmt[0] == 'lineinfo':
+            state.lineinfo = stmt[1]
+        else:
+            completion = walk(stmt)
+            if isinstance(completion, ReturnValue):
+                break
+    return completion
+
+#########################################################################
+# the completion of a statement list that is not the body of a function,
+# a return statement outside of a function body is an error reported by
+# the toplevel.
+def completed(completion):
+    if isinstance(completion, ReturnValue):
+        raise completion
+    return completion
 
 #########################################################################
 def exp_stmt(node):
@@ -1166,9 +1963,8 @@ def exp_stmt(node):
     (EXP_STMT, exp) = node
     assert_match(EXP_STMT,'exp-stmt')
 
-    walk(exp)
-    # statements don't return values
-    return
+    # the value is the return value of a function body ending in this statement
+    return walk(exp)
 
 #########################################################################
 def global_stmt(node):
@@ -1196,7 +1992,7 @@ def unify_stmt(node):
     assert_match(UNIFY, 'unify')
 
     term = walk(exp)
-    unifiers = unify(term, pattern)
+    unifiers = match_pattern(term, pattern)
     declare_unifiers(unifiers)
 
 #########################################################################
@@ -1208,7 +2004,20 @@ def return_stmt(node):
     
     retval = walk(e)
 
-    raise ReturnValue(retval)
+    return ReturnValue(retval)
+
+#########################################################################
+def tail_call_stmt(node):
+    if state.debugger: state.debugger.step()
+
+    (TAIL_CALL, (APPLY, f, arg)) = node
+    assert_match(TAIL_CALL, 'tail-call')
+
+    f_name = function_name(f)
+    f_val = walk(f)
+    arg_val = walk(arg)
+
+    return tail_call(f, f_name, f_val, arg_val)
 
 #########################################################################
 def break_stmt(node):
@@ -1230,6 +2039,56 @@ def throw_stmt(node):
 
     raise ThrowValue(throw_object)
 
+#########################################################################
+# map an exception caught by a try statement into an Asteroid value.
+# NOTE: we map user visible Python exceptions into standard Asteroid exceptions
+#       by constructing Exception objects - see prologue.ast
+def exception_value(inst):
+
+    def exception_object(kind, val):
+        return ('object',
+                ('struct-id', ('id', 'Exception')),
+                ('member-names', ('list',["kind","val","__init__"])),
+                ('object-memory',
+                 ('list',
+                  [('string', kind),
+                   ('string', val)])))
+
+    if isinstance(inst, ThrowValue):
+        return inst.value
+    elif isinstance(inst, PatternMatchFailed):
+        return exception_object('PatternMatchFailed', inst.value)
+    elif isinstance(inst, RedundantPatternFound):
+        return exception_object('RedundantPatternFound', str(inst))
+    elif isinstance(inst, NonLinearPatternError):
+        return exception_object('NonLinearPatternError', str(inst))
+    elif isinstance(inst, ArithmeticError):
+        return exception_object('ArithmeticError', str(inst))
+    elif isinstance(inst, FileNotFoundError):
+        return exception_object('FileNotFound', str(inst))
+    else:
+        # mapping general Python exceptions into Asteroid's SystemError
+        return exception_object('SystemError', str(inst))
+
+#########################################################################
+# walk the catch list and find the first catch clause whose pattern
+# matches the exception value.  the variables of the pattern are declared
+# and the index of the clause is returned, None if no clause matches.
+def select_catch(except_val, catch_list):
+
+    for (i, catch_val) in enumerate(catch_list):
+        (CATCH,
+         (CATCH_PATTERN, catch_pattern),
+         catch_stmts) = catch_val
+        unifiers = try_match(except_val, catch_pattern)
+        if unifiers is not None:
+            # handler found - null out error_trace
+            state.error_trace = None
+            declare_unifiers(unifiers)
+            return i
+
+    return None
+
 #########################################################################
 def try_stmt(node):
     if state.debugger: state.debugger.step()
@@ -1239,103 +2098,29 @@ def try_stmt(node):
      (CATCH_LIST, (LIST, catch_list))) = node
 
     try:
-        walk(try_stmts)
-
-    # NOTE: in Python the 'as inst' variable is only local to the catch block???
-    # NOTE: we map user visible Python exceptions into standard Asteroid exceptions
-    #       by constructing Exception objects - see prologue.ast
-    except ThrowValue as inst:
-        except_val = inst.value
-        inst_val = inst
+        completion = walk(try_stmts)
 
     except ReturnValue as inst:
         # return values should never be captured by user level try stmts - rethrow
         raise inst
 
-    except PatternMatchFailed as inst:
-        except_val = ('object',
-                         ('struct-id', ('id', 'Exception')),
-                         ('member-names', ('list',["kind","val","__init__"])),
-                         ('object-memory',
-                          ('list',
-                           [('string', 'PatternMatchFailed'),
-                            ('string', inst.value)])))
-        inst_val = inst
-
-    except RedundantPatternFound as inst:
-        except_val = ('object',
-                         ('struct-id', ('id', 'Exception')),
-                         ('member-names', ('list',["kind","val","__init__"])),
-                         ('object-memory',
-                          ('list',
-                           [('string', 'RedundantPatternFound'),
-                            ('string', str(inst))])))
-        inst_val = inst
-
-    except NonLinearPatternError as inst:
-        except_val = ('object',
-                         ('struct-id', ('id', 'Exception')),
-                         ('member-names', ('list',["kind","val","__init__"])),
-                         ('object-memory',
-                          ('list',
-                           [('string', 'NonLinearPatternError'),
-                            ('string', str(inst))])))
-        inst_val = inst
-
-    except ArithmeticError as inst:
-        except_val = ('object',
-                         ('struct-id', ('id', 'Exception')),
-                         ('member-names', ('list',["kind","val","__init__"])),
-                         ('object-memory',
-                          ('list',
-                           [('string', 'ArithmeticError'),
-                            ('string', str(inst))])))
-        inst_val = inst
-
-    except FileNotFoundError as inst:
-        except_val = ('object',
-                         ('struct-id', ('id', 'Exception')),
-                         ('member-names', ('list',["kind","val","__init__"])),
-                         ('object-memory',
-                          ('list',
-                           [('string', 'FileNotFound'),
-                            ('string', str(inst))])))
-        inst_val = inst
-
+    # NOTE: in Python the 'as inst' variable is only local to the catch block
     except Exception as inst:
-        # mapping general Python exceptions into Asteroid's SystemError
-        except_val = ('object',
-                         ('struct-id', ('id', 'Exception')),
-                         ('member-names', ('list',["kind","val","__init__"])),
-                         ('object-memory',
-                          ('list',
-                           [('string', 'SystemError'),
-                            ('string', str(inst))])))
+        except_val = exception_value(inst)
         inst_val = inst
 
     else:
         # no exceptions found in the try statements
-        return
+        return completion
 
-    # we had an exception - walk the catch list and find an appropriate set of
-    # catch statements.
-    for catch_val in catch_list:
-        (CATCH,
-         (CATCH_PATTERN, catch_pattern),
-         catch_stmts) = catch_val
-        try:
-            unifiers = unify(except_val, catch_pattern)
-        except PatternMatchFailed:
-            pass
-        else:
-            # handler found - null out error_trace
-            state.error_trace = None
-            declare_unifiers(unifiers)
-            walk(catch_stmts)
-            return
+    # we had an exception - find an appropriate set of catch statements.
+    i = select_catch(except_val, catch_list)
+    if i is None:
+        # no exception handler found - rethrow the exception
+        raise inst_val
 
-    # no exception handler found - rethrow the exception
-    raise inst_val
+    (CATCH, CATCH_PATTERN, catch_stmts) = catch_list[i]
+    return walk(catch_stmts)
 
 #########################################################################
 def loop_stmt(node):
@@ -1344,11 +2129,16 @@ def loop_stmt(node):
     (LOOP, body_stmts) = node
     assert_match(LOOP, 'loop')
 
+    completion = None
     try:
         while True:
-            walk(body_stmts)
+            completion = walk(body_stmts)
+            if isinstance(completion, ReturnValue):
+                break
     except Break:
-        pass
+        completion = None
+
+    return completion
 
 #########################################################################
 def while_stmt(node):
@@ -1357,19 +2147,24 @@ def while_stmt(node):
     (WHILE, (COND_EXP, cond), body_stmts) = node
     assert_match(WHILE, 'while')
 
+    completion = None
     try:
         (cond_type, cond_val) = walk(cond)
         if cond_type != 'boolean':
             raise ValueError("found '{}' expected 'boolean' in while loop"
                              .format(cond_type))
         while cond_val:
-            walk(body_stmts)
+            completion = walk(body_stmts)
+            if isinstance(completion, ReturnValue):
+                break
             (cond_type, cond_val) = walk(cond)
             if cond_type != 'boolean':
                 raise ValueError("found '{}' expected 'boolean' in while loop"
                                 .format(cond_type))
     except Break:
-        pass
+        completion = None
+
+    return completion
 
 #########################################################################
 def repeat_stmt(node):
@@ -1378,9 +2173,12 @@ def repeat_stmt(node):
     (REPEAT, body_stmts, (COND_EXP, cond)) = node
     assert_match(REPEAT, 'repeat')
 
+    completion = None
     try:
         while True:
-            walk(body_stmts)
+            completion = walk(body_stmts)
+            if isinstance(completion, ReturnValue):
+                break
             (cond_type, cond_val) = walk(cond)
             if cond_type != 'boolean':
                 raise ValueError("found '{}' expected 'boolean' in repeat loop"
@@ -1389,7 +2187,38 @@ def repeat_stmt(node):
                 break
 
     except Break:
-        pass
+        completion = None
+
+    return completion
+
+#########################################################################
+# the terms a for loop iterates over, the integers of a range are
+# generated as they are needed.
+def loop_terms(list_term_val):
+
+    if isinstance(list_term_val, range):
+        return map(integer_value, list_term_val)
+
+    # objects with an __iter__ member, e.g. sets, produce the values to iterate over
+    if list_term_val[0] == 'object':
+        iter_val = call_member(list_term_val, '__iter__', ('none', None))
+        if iter_val is not None:
+            return loop_terms(iter_val)
+
+    (LIST_TYPE, list_val, *_) = list_term_val
+
+    # a foreign generator lazily produces the values, e.g. the items of a hash
+    if LIST_TYPE == 'foreign' and list_val.__class__ is GeneratorType:
+        return list_val
+
+    if LIST_TYPE not in ['list','string','tuple']:
+        raise ValueError("iteration not supported for type '{}'".format(LIST_TYPE))
+
+    # if it is a string turn the list_val into a list of Asteroid characters.
+    if LIST_TYPE == 'string':
+        list_val = [('string',c) for c in list_val]
+
+    return list_val
 
 #########################################################################
 def for_stmt(node):
@@ -1401,16 +2230,10 @@ def for_stmt(node):
     (IN, pattern, list_term) = in_exp
 
     # expand the list_term
-    (LIST_TYPE, list_val) = walk(list_term)
-    if LIST_TYPE not in ['list','string','tuple']:
-        raise ValueError("iteration not supported for type '{}'".format(LIST_TYPE))
-
-    # if it is a string turn the list_val into a list of Asteroid characters.
-    if LIST_TYPE == 'string':
-        new_list = []
-        for c in list_val:
-            new_list.append(('string',c))
-        list_val = new_list
+    if is_range_exp(list_term):
+        list_val = loop_terms(walk_range(list_term))
+    else:
+        list_val = loop_terms(walk(list_term))
 
     # for each term on the list unfiy with pattern, declare the bound variables,
     # and execute the loop body in that context
@@ -1420,18 +2243,20 @@ def for_stmt(node):
     #      for (2,y) in [(1,11), (1,12), (1,13), (2,21), (2,22), (2,23)]  do
     #             print y.
     #      end for
+    completion = None
     try:
         for term in list_val:
-            try:
-                unifiers = unify(term,pattern)
-            except PatternMatchFailed:
-                pass
-            else:
+            unifiers = try_match(term, pattern)
+            if unifiers is not None:
                 declare_unifiers(unifiers)
-                walk(stmt_list)
-                
+                completion = walk(stmt_list)
+                if isinstance(completion, ReturnValue):
+                    break
+
     except Break:
-        pass
+        completion = None
+
+    return completion
 
 #########################################################################
 def match_stmt(node):
@@ -1441,7 +2266,7 @@ def match_stmt(node):
     assert_match(MATCH, 'match')
 
     walk(val)
-    walk(if_clauses)
+    return walk(if_clauses)
     
 #########################################################################
 def if_stmt(node):
@@ -1466,8 +2291,7 @@ def if_stmt(node):
                             .format(cond_type))
 
         if cond_val:
-            walk(stmts)
-            break
+            return walk(stmts)
 
 #########################################################################
 def struct_def_stmt(node):
@@ -1519,7 +2343,7 @@ def module_def_stmt(node):
 
     state.symbol_table.push_scope({})
     if state.debugger: state.debugger.enter_module(modname)
-    walk(stmts)
+    completed(walk(stmts))
     closure = state.symbol_table.get_closure()
     if state.debugger: state.debugger.exit_module(modname)
     state.symbol_table.pop_scope()
@@ -1547,8 +2371,22 @@ def apply_exp(node):
     if f[0] == 'id' and f[1] in builtins:
         return handle_builtins(node)
 
+    # the length of a range does not need the list
+    if f[0] == 'index' and f[2] == ('id', 'length') and is_range_exp(f[1]):
+        return range_length(f, walk_range(f[1]), walk(arg))
+
     # handle function application
-    # retrieve the function name from the AST
+    f_name = function_name(f)
+
+    # evaluate the function expression and the arguments
+    f_val = walk(f)
+    arg_val = walk(arg)
+
+    return apply_function(f, f_name, f_val, arg_val)
+
+#########################################################################
+# retrieve the function name from the AST of a function expression
+def function_name(f):
     if f[0] in ['function-exp','apply']:
         # cannot use the function expression as a name,
         # could be a very complex computation. the apply
@@ -1563,10 +2401,12 @@ def apply_exp(node):
     else:
         # just a regular function call
         (ID, f_name) = f
+    return f_name
 
-    # evaluate the function expression and the arguments
-    f_val = walk(f)
-    arg_val = walk(arg)
+#########################################################################
+# apply the function value f_val to the argument value arg_val where f is
+# the AST of the function expression and f_name the name of the function.
+def apply_function(f, f_name, f_val, arg_val):
 
     # object member function
     # NOTE: object member functions are passed an object reference.
@@ -1581,7 +2421,10 @@ def apply_exp(node):
 
     # regular function call
     elif f_val[0] == 'function-val':
-        result = handle_call(None, f_val, arg_val, f_name)
+        if f_val[1][0] == 'native':
+            result = handle_native_call(f_val[1][1], arg_val, f_name)
+        else:
+            result = handle_call(None, f_val, arg_val, f_name)
 
     # object constructor call
     elif f_val[0] == 'struct':
@@ -1656,7 +2499,12 @@ def index_exp(node):
     assert_match(INDEX, 'index')
 
     # look at the semantics of 'structure'
-    structure_val = walk(structure)
+    if is_range_exp(structure):
+        structure_val = walk_range(structure)
+        if isinstance(structure_val, range):
+            return read_range_at_ix(structure_val, ix)
+    else:
+        structure_val = walk(structure)
 
     # indexing/slicing
     result = read_at_ix(structure_val, ix)
@@ -1700,9 +2548,8 @@ def is_exp(node):
 
     term_val = walk(term)
 
-    try:
-        unifiers = unify(term_val, pattern)
-    except PatternMatchFailed:
+    unifiers = try_match(term_val, pattern)
+    if unifiers is None:
         return ('boolean', False)
     else:
         declare_unifiers(unifiers)
@@ -1715,16 +2562,47 @@ def in_exp(node):
     assert_match(IN, 'in')
 
     exp_val = walk(exp)
-    (EXP_LIST_TYPE, exp_list_val, *_) = walk(exp_list)
+    if is_range_exp(exp_list):
+        return in_list(exp_val, walk_range(exp_list))
+    else:
+        return in_list(exp_val, walk(exp_list))
+
+#########################################################################
+def in_list(exp_val, exp_list_val):
+
+    if isinstance(exp_list_val, range):
+        return boolean_value(exp_val[0] == 'integer' and exp_val[1] in exp_list_val)
+
+    if exp_list_val[0] == 'object':
+        # objects with a __contains__ member, e.g. sets, answer membership themselves
+        contains_val = call_member(exp_list_val, '__contains__', exp_val)
+        if contains_val is not None:
+            if contains_val[0] != 'boolean':
+                raise ValueError("member function __contains__ has to return a Boolean")
+            return contains_val
 
+    (EXP_LIST_TYPE, exp_list_val, *_) = exp_list_val
     if EXP_LIST_TYPE != 'list':
         raise ValueError("right argument to 'in' operator has to be a list")
 
     # we simply map our in operator to the Python in operator
-    if exp_val in exp_list_val:
-        return ('boolean', True)
-    else:
-        return ('boolean', False)
+    return boolean_value(exp_val in exp_list_val)
+
+#########################################################################
+def call_member(obj_val, name, arg_val):
+    '''
+    call the member function 'name' of an object with the given argument
+    value and return its value, None if the object has no such member.
+    '''
+    (OBJECT,
+     (STRUCT_ID, (ID, struct_id)),
+     (MEMBER_NAMES, (LIST, member_names)),
+     (OBJECT_MEMORY, (LIST, object_memory))) = obj_val
+
+    if name not in member_names:
+        return None
+    fval = object_memory[member_names.index(name)]
+    return handle_call(obj_val, fval, arg_val, 'member function ' + name)
 
 #########################################################################
 def if_exp(node):
@@ -1762,34 +2640,86 @@ def to_list_exp(node):
     assert_match(STOP, 'stop')
     assert_match(STEP, 'step')
 
-    (START_TYPE, start_val, *_) = walk(start)
-    (STOP_TYPE, stop_val, *_) = walk(stop)
-    (STEP_TYPE, step_val, *_) = walk(step)
+    return to_list(walk(start), walk(stop), walk(step))
+
+#########################################################################
+# compute the list value for the given start, stop, and step values
+def to_list(start, stop, step):
+    return integer_list(to_range(start, stop, step))
+
+#########################################################################
+# compute the Python range of the list value for the given start, stop,
+# and step values
+def to_range(start, stop, step):
+
+    (START_TYPE, start_val, *_) = start
+    (STOP_TYPE, stop_val, *_) = stop
+    (STEP_TYPE, step_val, *_) = step
 
     if START_TYPE != 'integer' or STOP_TYPE != 'integer' or STEP_TYPE != 'integer':
         raise ValueError("only integer values allowed in start, stop, or step")
 
-    out_list_val = []
+    return integer_range(int(start_val), int(stop_val), int(step_val))
 
-    if int(step_val) > 0: # generate the list
-        ix = int(start_val)
-        while ix <= int(stop_val):
-            out_list_val.append(('integer', ix))
-            ix += int(step_val)
+#########################################################################
+# integer ranges
+#
+# the for statement, the 'in' operator, indexing, and the 'length' member
+# function do not need the list of integers denoted by a range expression
+# like [1 to n] or range(n).  where a range expression is the operand of
+# one of these it is evaluated into a Python range and the list is never
+# built.  Python ranges never escape into Asteroid values, anywhere else
+# range expressions evaluate to lists.
+def is_range_exp(node):
+    return node[0] in ['to-list', 'raw-to-list'] \
+        or node[0] == 'apply' and node[1] == ('id', 'range')
 
-    elif int(step_val) == 0: # error
-        raise ValueError("step size of 0 not supported")
+#########################################################################
+# evaluate a range expression, the value is a Python range unless 'range'
+# is bound to some other function.
+def walk_range(node):
+    if node[0] == 'apply':
+        (APPLY, f, arg) = node
+        return apply_range(f, walk(f), walk(arg))
+    else:
+        (TOLIST,
+         (START, start),
+         (STOP, stop),
+         (STEP, step)) = node
+        return to_range(walk(start), walk(stop), walk(step))
 
-    elif int(step_val) < 0: # generate the list
-        ix = int(start_val)
-        while ix >= int(stop_val):
-            out_list_val.append(('integer', ix))
-            ix += int(step_val)
+#########################################################################
+def apply_range(f, f_val, arg_val):
+    if f_val[0] == 'function-val' and f_val[1] == ('native', native_functions['range']):
+        r = range_args(arg_val)
+        if r is not None:
+            return r
+    return apply_function(f, 'range', f_val, arg_val)
 
+#########################################################################
+def read_range_at_ix(r, ix):
+    if ix[0] == 'id' and ix[1] in list_member_functions:
+        # member functions are called on the list
+        return read_at_ix(integer_list(r), ix)
+    ix_val = walk(ix)
+    if ix_val[0] == 'integer':
+        try:
+            return integer_value(r[ix_val[1]])
+        except IndexError:
+            raise IndexError("list index out of range")
     else:
-        raise ValueError("{} not a valid step value".format(step_val))
+        list_val = integer_list(r)
+        return read_memory(list_val, list_val[1], ix_val)
 
-    return ('list', out_list_val)
+#########################################################################
+# apply the 'length' member function of the value of a range expression
+# f is the AST of the function expression structure@length.
+def range_length(f, r, arg_val):
+    if isinstance(r, range):
+        if arg_val[0] == 'none':
+            return integer_value(len(r))
+        r = integer_list(r)
+    return apply_function(f, 'length', read_at_ix(r, f[2]), arg_val)
 
 #########################################################################
 # NOTE: this is the value view of the head tail constructor, for the
@@ -1834,30 +2764,6 @@ def illegal_exp(_):
     # constructors.
     raise ValueError("not a valid expression")
 
-#########################################################################
-def set_ret_val(node):
-    (SET_RET_VAL, exp) = node
-    assert_match(SET_RET_VAL,'set-ret-val')
-
-    global function_return_value
-    val = walk(exp)
-    function_return_value.pop()
-    function_return_value.append(val)
-
-    return
-
-#########################################################################
-def clear_ret_val(node):
-    (CLEAR_RET_VAL,) = node
-    assert_match(CLEAR_RET_VAL, 'clear-ret-val')
-
-    global function_return_value    
-    # If we have no function return value, then append None    
-    if function_return_value != []:
-        function_return_value.pop()       
-    function_return_value.append(None)
-    return
-
 #########################################################################
 # walk
 #########################################################################
@@ -1874,12 +2780,10 @@ def walk(node):
 #########################################################################
 # a dictionary to associate tree nodes with node functions
 dispatch_dict = {
-    # statements - statements do not produce return values
+    # statements - statements produce completions, see 'program_value'
     'load-stmt'     : load_stmt,
     'stmt-list'     : stmt_list,
     'lineinfo'      : process_lineinfo,
-    'set-ret-val'   : set_ret_val,
-    'clear-ret-val' : clear_ret_val,
     'exp-stmt'      : exp_stmt,
     'noop'          : lambda node : None,
     'unify'         : unify_stmt,
@@ -1889,6 +2793,7 @@ dispatch_dict = {
     'for'           : for_stmt,
     'global'        : global_stmt,
     'return'        : return_stmt,
+    'tail-call'     : tail_call_stmt,
     'break'         : break_stmt,
     'match'         : match_stmt,
     'if'            : if_stmt,
@@ -1927,6 +2832,16 @@ dispatch_dict = {
     'deref'         : illegal_exp,
 }
 
+#########################################################################
+# the execution engines available to the interpreter.  an engine is a
+# function that executes an AST, the interpreter runs programs, modules,
+# and function bodies with the engine named in 'state.engine'.  the
+# tree walker is always available, other engines add themselves to this
+# dictionary, see 'compiler.py'.
+engines = {
+    'walk'          : walk,
+}
+
 ##############################################################################################
 # *** The Redundant Pattern Detector ***
 #
@@ -1953,9 +2868,32 @@ dispatch_dict = {
 # are redundant. If so, a warning is printed to the console identifing the offending
 # pattern(s)
 #
+# The outcome of the check only depends on the body list, therefore the check is run only
+# once for each body list and its outcome is kept in the redundancy cache: a body list
+# maps to a pair (lineinfo, redundancy) where 'lineinfo' is the lineinfo the check leaves
+# behind and 'redundancy' is either None or the redundant pair of patterns along with
+# their locations.  The cache is bounded, see 'NodeCache' in support.py.
+#
 ################################################################################################
+redundancy_cache = NodeCache()
+
 def check_redundancy( body_list, f_name ):
 
+    entry = redundancy_cache.get(body_list)
+    if entry:
+        (lineinfo, redundancy) = entry
+        state.lineinfo = lineinfo
+    else:
+        redundancy = find_redundancy(body_list)
+        redundancy_cache.put(body_list, (state.lineinfo, redundancy))
+
+    if redundancy:
+        (ptrn_h, ptrn_l, location_h, location_l) = redundancy
+        raise RedundantPatternFound( ptrn_h , ptrn_l , f_name, location_h, location_l )
+
+################################################################################################
+def find_redundancy( body_list ):
+
     #Node type assertions
     #or "Make sure we are walking down the right part of the tree"
     (BODY_LIST, function_bodies ) = body_list
@@ -2004,5 +2942,7 @@ def check_redundancy( body_list, f_name ):
             except PatternMatchFailed:          #NO CONFLICTION
                 pass
             else:                               #CONFLICTION
-                raise RedundantPatternFound( ptrn_h , ptrn_l , f_name, location_h, location_l )
+                return ( ptrn_h , ptrn_l , location_h, location_l )
+
+    return None
 